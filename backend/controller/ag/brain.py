@@ -1,34 +1,78 @@
-import os
-import json
-import google.generativeai as genai
 from dotenv import load_dotenv
-from .schemas import FixPacket
+from . import providers, patches, jsonrepair, schemas
+from .streaming import IncrementalPacketParser
 
 load_dotenv()
 
-def generate_fix_packet(code: str, error_log: str, error_type: str) -> dict:
+GENERATION_CONFIG = {
+    "temperature": 0.2,
+    "top_p": 0.95,
+    "top_k": 64,
+    "max_output_tokens": 8192,
+    "response_mime_type": "application/json",
+}
+
+# What each candidate in the prompt is asked to be, in order; past the list
+# every further one is another distinct approach
+CANDIDATE_ROLES = ["", "Alternative Approach, ", "Defensive/Robust Approach, "]
+
+def generate_fix_packet(code: str, error_log: str, error_type: str, candidate_format: str = patches.FULL,
+                        candidate_count: int = 3) -> dict:
     """
-    Generates a reproduction script and 3 candidate fixes using Gemini 1.5 Flash.
+    Generates a reproduction script and candidate_count candidate fixes using Gemini 1.5 Flash.
+    Candidates are full files, or unified diffs with candidate_format=patches.DIFF.
     Returns a dictionary matching the FixPacket schema.
     """
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("Missing GEMINI_API_KEY")
+    model = providers.gemini_model(GENERATION_CONFIG)
+    system_prompt, user_prompt = _build_prompts(code, error_log, error_type, candidate_format, candidate_count)
+
+    try:
+        response = model.generate_content([system_prompt, user_prompt])
+        # Validated straight from the JSON text; fences, trailing commas etc.
+        # are repaired rather than paying for DeepSeek
+        return jsonrepair.loads(response.text, schemas.packet_from_json, _repair_check(candidate_format))
+    except Exception as e:
+        print(f"Gemini Brain Error: {e}")
+        raise e
+
+def stream_fix_packet(code: str, error_log: str, error_type: str, on_event,
+                      candidate_format: str = patches.FULL, candidate_count: int = 3) -> dict:
+    """
+    Same as generate_fix_packet, but streams the response and calls
+    on_event(kind, index, value) the moment the reproduction script and each
+    candidate are complete, long before the whole packet is.
+    """
+    model = providers.gemini_model(GENERATION_CONFIG)
+    system_prompt, user_prompt = _build_prompts(code, error_log, error_type, candidate_format, candidate_count)
+    parser = IncrementalPacketParser()
+    chunks = []
 
-    genai.configure(api_key=api_key)
+    try:
+        for chunk in model.generate_content([system_prompt, user_prompt], stream=True):
+            chunks.append(chunk.text)
+            for event in parser.feed(chunk.text):
+                on_event(*event)
+        return jsonrepair.loads("".join(chunks), schemas.packet_from_json, _repair_check(candidate_format))
+    except Exception as e:
+        print(f"Gemini Brain Error: {e}")
+        raise e
 
-    generation_config = {
-        "temperature": 0.2,
-        "top_p": 0.95,
-        "top_k": 64,
-        "max_output_tokens": 8192,
-        "response_mime_type": "application/json",
-    }
+def _repair_check(candidate_format: str):
+    # A repaired packet whose code no longer parses had a quote misread;
+    # failing it lets the fallback model answer instead
+    return lambda packet: schemas.packet_parses(packet, candidates=candidate_format != patches.DIFF)
 
-    model = genai.GenerativeModel(
-        model_name="gemini-1.5-flash-latest",
-        generation_config=generation_config,
-    )
+def _build_prompts(code: str, error_log: str, error_type: str, candidate_format: str = patches.FULL,
+                   candidate_count: int = 3):
+    if candidate_format == patches.DIFF:
+        candidate_kind = "Unified Diff"
+        candidate_rule = patches.DIFF_INSTRUCTIONS
+    else:
+        candidate_kind = "Full Code"
+        candidate_rule = "Candidate fixes must be the FULL file content, not just diffs."
+    roles = CANDIDATE_ROLES + ["Another Distinct Approach, "] * (candidate_count - len(CANDIDATE_ROLES))
+    candidates = ",\n            ".join(
+        f'"Candidate Fix {i + 1} ({roles[i]}{candidate_kind})"' for i in range(candidate_count))
 
     system_prompt = f"""
     You are the Truth Engine, a high-reliability Python repair system.
@@ -39,16 +83,15 @@ def generate_fix_packet(code: str, error_log: str, error_type: str) -> dict:
     {{
         "reproduction_script": "A standalone Python script that reproduces the error. It must fail with the same error type.",
         "candidates": [
-            "Candidate Fix 1 (Full Code)",
-            "Candidate Fix 2 (Alternative Approach)",
-            "Candidate Fix 3 (Defensive/Robust Approach)"
+            {candidates}
         ]
     }}
 
     Rules:
     1. The reproduction script must be self-contained (mock data if needed).
-    2. Candidate fixes must be the FULL file content, not just diffs.
+    2. {candidate_rule}
     3. Do not use Markdown backticks in the JSON string values.
+    4. Return exactly {candidate_count} candidate{"s" if candidate_count != 1 else ""}.
     """
 
     user_prompt = f"""
@@ -59,12 +102,4 @@ def generate_fix_packet(code: str, error_log: str, error_type: str) -> dict:
     {error_log}
     """
 
-    try:
-        response = model.generate_content([system_prompt, user_prompt])
-        json_response = json.loads(response.text)
-        # Validate with Pydantic
-        packet = FixPacket(**json_response)
-        return packet.model_dump()
-    except Exception as e:
-        print(f"Gemini Brain Error: {e}")
-        raise e
+    return system_prompt, user_prompt
@@ -0,0 +1,155 @@
+import os
+import time
+import threading
+from collections import deque
+
+# A provider's circuit opens once at least BREAKER_MIN_CALLS calls in the last
+# BREAKER_WINDOW_SECONDS include BREAKER_ERROR_RATE failures, or
+# BREAKER_SLOW_RATE calls slower than BREAKER_SLOW_SECONDS. After
+# BREAKER_COOLDOWN_SECONDS one probe call is let through; its outcome closes
+# the circuit or opens it for another cooldown.
+WINDOW_SECONDS = float(os.getenv("BREAKER_WINDOW_SECONDS", "120"))
+MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+SLOW_SECONDS = float(os.getenv("BREAKER_SLOW_SECONDS", "20"))
+SLOW_RATE = float(os.getenv("BREAKER_SLOW_RATE", "0.8"))
+COOLDOWN_SECONDS = float(os.getenv("BREAKER_COOLDOWN_SECONDS", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Most outcomes kept per provider, whatever their age
+_MAX_SAMPLES = 200
+
+
+class CircuitBreaker:
+    """
+    Health of one provider, shared across warm invocations of the same
+    process. Callers ask allow() before a call and record() its outcome.
+    """
+
+    def __init__(self, name: str, clock=time.monotonic, window_seconds: float = None,
+                 min_calls: int = None, error_rate: float = None, slow_seconds: float = None,
+                 slow_rate: float = None, cooldown_seconds: float = None):
+        self.name = name
+        self._clock = clock
+        self.window_seconds = WINDOW_SECONDS if window_seconds is None else window_seconds
+        self.min_calls = MIN_CALLS if min_calls is None else min_calls
+        self.error_rate = ERROR_RATE if error_rate is None else error_rate
+        self.slow_seconds = SLOW_SECONDS if slow_seconds is None else slow_seconds
+        self.slow_rate = SLOW_RATE if slow_rate is None else slow_rate
+        self.cooldown_seconds = COOLDOWN_SECONDS if cooldown_seconds is None else cooldown_seconds
+
+        # (timestamp, ok, seconds)
+        self._outcomes = deque(maxlen=_MAX_SAMPLES)
+        self._state = CLOSED
+        self._opened_at = None
+        self._probe_started = None
+        self._counters = {"opened": 0, "rejected": 0, "probes": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow(self) -> bool:
+        """
+        Whether to call the provider now. Always while closed; while open,
+        only once the cooldown is over, and then for a single probe at a
+        time (a probe that never reports back is replaced after a cooldown).
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            now = self._clock()
+            if self._state == OPEN and now - self._opened_at >= self.cooldown_seconds:
+                self._state = HALF_OPEN
+            if self._state == HALF_OPEN and (self._probe_started is None
+                                             or now - self._probe_started >= self.cooldown_seconds):
+                self._probe_started = now
+                self._counters["probes"] += 1
+                return True
+            self._counters["rejected"] += 1
+            return False
+
+    def record(self, ok: bool, seconds: float):
+        """
+        A finished call. Outside the closed state any call's outcome (the probe,
+        or one made because no provider was healthy) decides the circuit.
+        """
+        with self._lock:
+            now = self._clock()
+            if self._state != CLOSED:
+                if ok and seconds < self.slow_seconds:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                    self._outcomes.append((now, ok, seconds))
+                else:
+                    self._open(now)
+                return
+
+            self._outcomes.append((now, ok, seconds))
+            calls, errors, slow = self._window(now)
+            if calls >= self.min_calls and (errors / calls >= self.error_rate or slow / calls >= self.slow_rate):
+                print(f"Circuit for {self.name} opened: {errors}/{calls} failed, {slow}/{calls} slow")
+                self._open(now)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            now = self._clock()
+            calls, errors, slow = self._window(now)
+            latencies = sorted(seconds for _, _, seconds in self._outcomes)
+            return dict(
+                self._counters,
+                state=self._state,
+                calls=calls,
+                error_rate=(errors / calls) if calls else 0.0,
+                slow_rate=(slow / calls) if calls else 0.0,
+                p50_seconds=latencies[len(latencies) // 2] if latencies else None,
+            )
+
+    def _open(self, now: float):
+        self._state = OPEN
+        self._opened_at = now
+        self._probe_started = None
+        self._counters["opened"] += 1
+
+    def _window(self, now: float):
+        # Caller holds the lock
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+        errors = sum(1 for _, ok, _ in self._outcomes if not ok)
+        slow = sum(1 for _, _, seconds in self._outcomes if seconds >= self.slow_seconds)
+        return len(self._outcomes), errors, slow
+
+
+_breakers = {}
+_registry_lock = threading.Lock()
+
+
+def for_provider(name: str) -> CircuitBreaker:
+    """
+    The process-wide breaker for a provider ("gemini", "deepseek", "groq").
+    """
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _registry_lock:
+            breaker = _breakers.setdefault(name, CircuitBreaker(name))
+    return breaker
+
+
+def get_stats() -> dict:
+    """
+    Per-provider circuit state and window health for this warm container.
+    """
+    return {name: breaker.snapshot() for name, breaker in list(_breakers.items())}
+
+
+def reset():
+    """
+    Forgets every provider's history (tests).
+    """
+    with _registry_lock:
+        _breakers.clear()
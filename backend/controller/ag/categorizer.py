@@ -1,19 +1,159 @@
-import os
-from groq import Groq
+import io
+import re
+import time
+import tokenize
+import hashlib
+from collections import OrderedDict
 from dotenv import load_dotenv
+from . import providers, breaker
 
 load_dotenv()
 
+# Exceptions whose name alone settles the category
+SYNTAX_EXCEPTIONS = {"SyntaxError", "IndentationError", "TabError"}
+RUNTIME_EXCEPTIONS = {
+    "ZeroDivisionError", "KeyError", "IndexError", "TypeError", "ValueError",
+    "AttributeError", "NameError", "UnboundLocalError", "ImportError",
+    "ModuleNotFoundError", "RecursionError", "OverflowError", "FileNotFoundError",
+    "FloatingPointError", "StopIteration", "UnicodeDecodeError", "UnicodeEncodeError",
+    "JSONDecodeError", "MemoryError",
+}
+
+# Same spirit as the sandbox's banned list: code like this is SECURITY whatever
+# the traceback says. Matched against the code with comments and strings blanked
+SECURITY_PATTERN = re.compile(
+    r"\bimport\s+(?:os|subprocess|shutil)\b|\bfrom\s+(?:os|subprocess|shutil)\s+import\b"
+    r"|\bos\.(?:system|popen|spawn|exec)|\bsubprocess\.\w+|\b(?:eval|exec|__import__)\s*\("
+)
+
+# Last "SomeError: message" line of a traceback (dotted names allowed;
+# StopIteration and StopAsyncIteration too)
+EXCEPTION_LINE = re.compile(r"^\s*(?:[A-Za-z_]\w*\.)*([A-Za-z_]\w*(?:Error|Exception|Exit|Interrupt|Iteration))\b\s*(?::.*)?$")
+
+# Llama answers kept per process; warm Lambdas reuse them
+CACHE_SIZE = 256
+
+_cache = OrderedDict()
+_stats = {"rule_hits": 0, "cache_hits": 0, "llm_calls": 0}
+
+
 def classify_error(code: str, error_log: str) -> str:
     """
     Classifies the error into one of: SYNTAX, LOGIC, RUNTIME, SECURITY.
-    Uses Groq (Llama 3) for fast inference.
+    Tries local rules first; uses Groq (Llama 3) only when they are ambiguous.
+    """
+    category = classify_fast(code, error_log)
+    if category:
+        return category
+
+    category = _classify_with_llm(code, error_log)
+    if not category.startswith("UNKNOWN"):
+        _cache[_cache_key(code, error_log)] = category
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return category
+
+
+def classify_fast(code: str, error_log: str):
+    """
+    Rules, then previous Llama answers. Returns None when only Llama can decide.
+    """
+    category = classify_by_rules(code, error_log)
+    if category:
+        _stats["rule_hits"] += 1
+        return category
+
+    key = _cache_key(code, error_log)
+    if key in _cache:
+        _cache.move_to_end(key)
+        _stats["cache_hits"] += 1
+        return _cache[key]
+
+    return None
+
+
+def classify_by_rules(code: str, error_log: str):
+    """
+    Local fast path. Returns a category, or None when the rules can't decide.
+    """
+    if code and SECURITY_PATTERN.search(code) and SECURITY_PATTERN.search(_without_comments_and_strings(code)):
+        return "SECURITY"
+
+    exception = last_exception_name(error_log)
+    if exception in SYNTAX_EXCEPTIONS:
+        return "SYNTAX"
+    if exception in RUNTIME_EXCEPTIONS:
+        return "RUNTIME"
+
+    # No usable exception line: the code not compiling is still conclusive
+    if exception is None and code:
+        try:
+            compile(code, "<submission>", "exec")
+        except SyntaxError:
+            return "SYNTAX"
+        except ValueError:
+            pass
+
+    return None
+
+
+def last_exception_name(error_log: str):
+    """
+    Returns the exception class name from the final exception line, or None.
+    """
+    for line in reversed((error_log or "").strip().splitlines()):
+        match = EXCEPTION_LINE.match(line)
+        if match:
+            return match.group(1)
+    return None
+
+
+def get_stats() -> dict:
     """
-    api_key = os.getenv("GROQ_API_KEY")
-    if not api_key:
+    How often the Llama round trip was avoided in this process.
+    """
+    total = _stats["rule_hits"] + _stats["cache_hits"] + _stats["llm_calls"]
+    avoided = _stats["rule_hits"] + _stats["cache_hits"]
+    return dict(_stats, total=total, hit_rate=(avoided / total) if total else 0.0)
+
+
+def _without_comments_and_strings(code: str) -> str:
+    # Each comment and string literal becomes a space, so "# don't use
+    # eval(x)" or 'os.system' can't settle the category. Code that doesn't
+    # tokenize is returned as-is
+    lines = io.StringIO(code).readlines()
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+    literal = {tokenize.COMMENT, tokenize.STRING, getattr(tokenize, "FSTRING_MIDDLE", tokenize.STRING)}
+
+    chunks, last = [], 0
+    try:
+        for token in tokenize.generate_tokens(iter(lines).__next__):
+            if token.type in literal:
+                start = offsets[token.start[0] - 1] + token.start[1]
+                chunks += [code[last:start], " "]
+                last = offsets[token.end[0] - 1] + token.end[1]
+    except (tokenize.TokenError, SyntaxError):
+        return code
+    chunks.append(code[last:])
+    return "".join(chunks)
+
+
+def _cache_key(code: str, error_log: str) -> str:
+    return hashlib.sha256(f"{code}\0{error_log}".encode("utf-8")).hexdigest()
+
+
+def _classify_with_llm(code: str, error_log: str) -> str:
+    client = providers.groq_client()
+    if client is None:
         return "UNKNOWN (Missing API Key)"
+    circuit = breaker.for_provider("groq")
+    if not circuit.allow():
+        # The speculative generic-prompt generation carries on without it
+        return "UNKNOWN (Circuit Open)"
 
-    client = Groq(api_key=api_key)
+    _stats["llm_calls"] += 1
 
     prompt = f"""
     You are a Senior Python Debugger.
@@ -35,6 +175,7 @@ def classify_error(code: str, error_log: str) -> str:
     Return ONLY the category name (e.g., "SYNTAX"). Do not add any explanation.
     """
 
+    t0 = time.perf_counter()
     try:
         chat_completion = client.chat.completions.create(
             messages=[
@@ -47,7 +188,10 @@ def classify_error(code: str, error_log: str) -> str:
             temperature=0,
             max_tokens=10,
         )
-        return chat_completion.choices[0].message.content.strip().upper()
+        category = chat_completion.choices[0].message.content.strip().upper()
+        circuit.record(True, time.perf_counter() - t0)
+        return category
     except Exception as e:
+        circuit.record(False, time.perf_counter() - t0)
         print(f"Categorizer Error: {e}")
         return "UNKNOWN"
@@ -0,0 +1,55 @@
+import ast
+import hashlib
+from . import fixcache
+
+
+class _Canonicalizer(ast.NodeTransformer):
+    """
+    Puts the names in one import statement into a fixed order. Keyword
+    arguments keep theirs: a callee taking **kwargs sees it.
+    """
+
+    def visit_Import(self, node):
+        node.names.sort(key=lambda alias: (alias.name, alias.asname or ""))
+        return node
+
+    def visit_ImportFrom(self, node):
+        node.names.sort(key=lambda alias: (alias.name, alias.asname or ""))
+        return node
+
+
+def fingerprint(code: str) -> str:
+    """
+    Equal for candidates that only differ in whitespace, comments or import
+    name order.
+    """
+    try:
+        canonical = ast.unparse(_Canonicalizer().visit(ast.parse(code)))
+    except (SyntaxError, ValueError):
+        canonical = fixcache.normalize_code(code)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def dedupe(candidates: list):
+    """
+    Returns (distinct, index_map): the first candidate of each equivalence
+    class, and for every original candidate the index of its class in
+    `distinct`.
+    """
+    distinct = []
+    index_map = []
+    seen = {}
+    for candidate in candidates:
+        key = fingerprint(candidate)
+        if key not in seen:
+            seen[key] = len(distinct)
+            distinct.append(candidate)
+        index_map.append(seen[key])
+    return distinct, index_map
+
+
+def expand(results: list, index_map: list) -> list:
+    """
+    Results for the distinct candidates, back in original candidate order.
+    """
+    return [results[i] for i in index_map]
@@ -1,23 +1,22 @@
-import os
-import json
-from openai import OpenAI
 from dotenv import load_dotenv
-from .schemas import FixPacket
+from . import providers, patches, schemas
 
 load_dotenv()
 
-def generate_fix_packet(code: str, error_log: str, error_type: str) -> dict:
+# Returned instead of raising when DeepSeek itself fails
+FAILED_PACKET = {
+    "reproduction_script": "# Failed to generate reproduction script",
+    "candidates": ["# AI generation failed completely."]
+}
+
+def generate_fix_packet(code: str, error_log: str, error_type: str, candidate_format: str = patches.FULL,
+                        candidate_count: int = 3) -> dict:
     """
     Fallback: Generates fixes using DeepSeek V3 (via OpenAI client).
     """
-    api_key = os.getenv("DEEPSEEK_API_KEY")
-    if not api_key:
-        raise ValueError("Missing DEEPSEEK_API_KEY")
-
-    client = OpenAI(
-        api_key=api_key,
-        base_url="https://api.deepseek.com"
-    )
+    client = providers.deepseek_client()
+    diff_rule = patches.DIFF_INSTRUCTIONS if candidate_format == patches.DIFF else ""
+    fixes = ", ".join(f'"Fix {i + 1}"' for i in range(candidate_count))
 
     system_prompt = f"""
     You are the Truth Engine. The primary model failed. You are the safety net.
@@ -27,9 +26,10 @@ def generate_fix_packet(code: str, error_log: str, error_type: str) -> dict:
     Return a JSON object with this EXACT structure:
     {{
         "reproduction_script": "Standalone python script to reproduce the error",
-        "candidates": ["Fix 1", "Fix 2", "Fix 3"]
+        "candidates": [{fixes}]
     }}
     Do not use Markdown formatting in the response. Return raw JSON.
+    {diff_rule}
     """
 
     user_prompt = f"""
@@ -51,14 +51,8 @@ def generate_fix_packet(code: str, error_log: str, error_type: str) -> dict:
         )
         
         content = response.choices[0].message.content
-        json_response = json.loads(content)
-        
-        packet = FixPacket(**json_response)
-        return packet.model_dump()
+        return schemas.packet_from_json(content)
     except Exception as e:
         print(f"DeepSeek Fallback Error: {e}")
         # Last resort: Return empty structure to prevent total crash
-        return {
-            "reproduction_script": "# Failed to generate reproduction script",
-            "candidates": ["# AI generation failed completely."]
-        }
+        return dict(FAILED_PACKET)
@@ -0,0 +1,280 @@
+import io
+import os
+import re
+import ast
+import json
+import time
+import sqlite3
+import hashlib
+import tokenize
+import threading
+from collections import OrderedDict
+
+# File paths, memory addresses and line numbers differ between otherwise
+# identical tracebacks (different upload dirs, different runs).
+_TRACEBACK_NOISE = [
+    (re.compile(r'File "[^"]*"'), 'File "<file>"'),
+    (re.compile(r"\bline \d+"), "line N"),
+    (re.compile(r"\b0x[0-9a-fA-F]+\b"), "0x?"),
+    (re.compile(r"[ \t]+"), " "),
+]
+
+
+def normalize_code(code: str) -> str:
+    """
+    Canonical form of the code: comments and formatting dropped.
+    Code that doesn't parse keeps its indentation (it may be the bug) and
+    only loses comment lines, blank lines and trailing whitespace.
+    """
+    try:
+        return ast.unparse(ast.parse(code))
+    except (SyntaxError, ValueError):
+        pass
+
+    lines = []
+    try:
+        tokens = tokenize.generate_tokens(io.StringIO(code).readline)
+        comment_lines = {tok.start[0] for tok in tokens if tok.type == tokenize.COMMENT}
+    except (tokenize.TokenError, SyntaxError):
+        comment_lines = set()
+    for number, line in enumerate(code.splitlines(), start=1):
+        if number in comment_lines and line.lstrip().startswith("#"):
+            continue
+        line = line.rstrip()
+        if line:
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def normalize_traceback(error_log: str) -> str:
+    lines = []
+    for line in (error_log or "").strip().splitlines():
+        for pattern, replacement in _TRACEBACK_NOISE:
+            line = pattern.sub(replacement, line)
+        line = line.strip()
+        if line:
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def cache_key(code: str, error_log: str) -> str:
+    normalized = f"{normalize_code(code)}\0{normalize_traceback(error_log)}"
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class MemoryBackend:
+    """
+    In-process LRU with per-entry expiry. Lives as long as the warm Lambda.
+    """
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: dict, ttl: float):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteBackend:
+    """
+    Single-file cache, e.g. on /tmp (survives warm starts) or a local dev disk.
+    LRU by last access time.
+    """
+
+    def __init__(self, path: str, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fix_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM fix_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM fix_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE fix_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return json.loads(row[0])
+
+    def set(self, key: str, value: dict, ttl: float):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fix_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + ttl, now),
+            )
+            self._conn.execute("DELETE FROM fix_cache WHERE expires_at <= ?", (now,))
+            self._conn.execute(
+                "DELETE FROM fix_cache WHERE key IN ("
+                "SELECT key FROM fix_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+
+class DynamoDBBackend:
+    """
+    Shared across all controller instances. Expiry uses the table's TTL
+    attribute ("ttl", same as PVE_Connections); size is bounded by TTL, not LRU.
+    """
+
+    def __init__(self, table_name: str):
+        import boto3
+        self._table = boto3.resource("dynamodb").Table(table_name)
+
+    def get(self, key: str):
+        item = self._table.get_item(Key={"cacheKey": key}).get("Item")
+        # DynamoDB deletes expired items lazily, so check ourselves
+        if item is None or int(item["ttl"]) <= time.time():
+            return None
+        return json.loads(item["value"])
+
+    def set(self, key: str, value: dict, ttl: float):
+        self._table.put_item(Item={
+            "cacheKey": key,
+            "value": json.dumps(value),
+            "ttl": int(time.time() + ttl),
+        })
+
+    def claim(self, key: str, seconds: float) -> bool:
+        # Conditional put: only one controller instance holds an unexpired claim
+        now = int(time.time())
+        try:
+            self._table.put_item(
+                Item={"cacheKey": f"inflight#{key}", "ttl": now + int(seconds)},
+                ConditionExpression="attribute_not_exists(cacheKey) OR #ttl <= :now",
+                ExpressionAttributeNames={"#ttl": "ttl"},
+                ExpressionAttributeValues={":now": now},
+            )
+            return True
+        except self._table.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+
+    def release(self, key: str):
+        self._table.delete_item(Key={"cacheKey": f"inflight#{key}"})
+
+
+class FixCache:
+    """
+    Generation cache in front of brain/fallback, keyed on normalized code and
+    traceback. Backend errors are logged and treated as misses.
+    """
+
+    def __init__(self, backend, ttl: float = 3600):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def get(self, code: str, error_log: str):
+        if self.backend is None:
+            return None
+        try:
+            value = self.backend.get(cache_key(code, error_log))
+        except Exception as e:
+            print(f"Fix cache read failed: {e}")
+            self.errors += 1
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, code: str, error_log: str, value: dict):
+        if self.backend is None:
+            return
+        try:
+            self.backend.set(cache_key(code, error_log), value, self.ttl)
+        except Exception as e:
+            print(f"Fix cache write failed: {e}")
+            self.errors += 1
+
+    def claim(self, code: str, error_log: str, seconds: float) -> bool:
+        """
+        Marks this (code, traceback) as being generated by this instance, for
+        backends shared between instances (DynamoDB). False means another
+        instance holds the claim and will put() the packet; backends without
+        claims always return True. Errors count as a successful claim.
+        """
+        claim = getattr(self.backend, "claim", None)
+        if claim is None:
+            return True
+        try:
+            return claim(cache_key(code, error_log), seconds)
+        except Exception as e:
+            print(f"Fix cache claim failed: {e}")
+            self.errors += 1
+            return True
+
+    def release(self, code: str, error_log: str):
+        release = getattr(self.backend, "release", None)
+        if release is None:
+            return
+        try:
+            release(cache_key(code, error_log))
+        except Exception as e:
+            print(f"Fix cache release failed: {e}")
+            self.errors += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+
+def from_env() -> FixCache:
+    """
+    FIX_CACHE_BACKEND: memory (default) | sqlite | dynamodb | off
+    """
+    kind = os.getenv("FIX_CACHE_BACKEND", "memory").lower()
+    ttl = float(os.getenv("FIX_CACHE_TTL_SECONDS", "3600"))
+    size = int(os.getenv("FIX_CACHE_SIZE", "1000"))
+
+    try:
+        if kind == "memory":
+            backend = MemoryBackend(size)
+        elif kind == "sqlite":
+            backend = SQLiteBackend(os.getenv("FIX_CACHE_PATH", "/tmp/pve-fix-cache.sqlite"), size)
+        elif kind == "dynamodb":
+            backend = DynamoDBBackend(os.getenv("FIX_CACHE_TABLE", "PVE_FixCache"))
+        else:
+            backend = None
+    except Exception as e:
+        print(f"Fix cache disabled, backend '{kind}' failed to start: {e}")
+        backend = None
+
+    return FixCache(backend, ttl)
@@ -0,0 +1,90 @@
+import asyncio
+import threading
+from collections import deque
+
+
+class LatencyTracker:
+    """
+    Sliding window of recent call latencies (seconds), shared across warm
+    invocations of the same process.
+    """
+
+    def __init__(self, window: int = 100):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, p: float):
+        """
+        Nearest-rank percentile, or None with no samples yet.
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        rank = max(0, min(len(samples) - 1, round(p / 100 * len(samples)) - 1))
+        return samples[rank]
+
+
+def hedge_delay(tracker: LatencyTracker, percentile: float, min_samples: int, default: float) -> float:
+    """
+    How long to wait on the primary before hedging: its observed latency
+    percentile once there is enough history, else the configured default.
+    """
+    if len(tracker) < min_samples:
+        return default
+    return tracker.percentile(percentile)
+
+
+async def hedged(primary, secondary, delay: float, is_valid):
+    """
+    Awaits primary(); if it hasn't produced a valid result after `delay`
+    seconds (or fails sooner), also starts secondary(). With delay=None the
+    secondary only starts once the primary failed. The first valid result
+    wins and the other call is cancelled.
+    primary/secondary are zero-argument callables returning awaitables.
+    Returns (result, index) with index 0 for primary, 1 for secondary. If
+    neither is valid, returns the last invalid result, else re-raises the last error.
+    """
+    tasks = {asyncio.ensure_future(primary()): 0}
+    try:
+        await asyncio.wait(tasks, timeout=delay)
+
+        invalid = None
+        last_error = None
+        started_secondary = False
+        pending = set(tasks)
+
+        while pending or not started_secondary:
+            for task in [t for t in pending if t.done()]:
+                pending.discard(task)
+                if task.exception() is not None:
+                    last_error = task.exception()
+                elif is_valid(task.result()):
+                    return task.result(), tasks[task]
+                else:
+                    invalid = (task.result(), tasks[task])
+
+            if not started_secondary:
+                started_secondary = True
+                secondary_task = asyncio.ensure_future(secondary())
+                tasks[secondary_task] = 1
+                pending.add(secondary_task)
+
+            if pending:
+                await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+        if invalid is not None:
+            return invalid
+        raise last_error
+    finally:
+        # The loser (or both, if we were cancelled ourselves)
+        for task in tasks:
+            if not task.done():
+                task.cancel()
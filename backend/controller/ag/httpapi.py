@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import threading
+from types import SimpleNamespace
+
+# Direct-HTTP stand-ins for the three vendor SDKs, exposing just the surface
+# the controller uses (chat.completions.create / generate_content), so
+# ag.providers can hand out either. Everything shares one httpx.Client and
+# with it one keep-alive pool.
+
+TIMEOUT = float(os.getenv("HTTP_TIMEOUT_SECONDS", "60"))
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+# First retry waits this long, doubling each time (Retry-After wins if sent)
+RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF_SECONDS", "0.5"))
+
+_RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+_client = None
+_lock = threading.Lock()
+
+
+class APIError(Exception):
+    """
+    A provider answered with an error status, or could not be reached.
+    """
+
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def shared_client():
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                import httpx
+                _client = httpx.Client(
+                    timeout=httpx.Timeout(TIMEOUT, connect=CONNECT_TIMEOUT),
+                    limits=httpx.Limits(max_keepalive_connections=10),
+                )
+    return _client
+
+
+def reset():
+    """
+    Closes the shared client (tests, fork safety).
+    """
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+
+
+def post_json(url: str, headers: dict, body: dict) -> dict:
+    with _send(url, headers, body) as response:
+        response.read()
+        return response.json()
+
+
+def stream_events(url: str, headers: dict, body: dict):
+    """
+    Yields the decoded "data:" payloads of a server-sent event stream.
+    Retries only cover the request itself; once events have been yielded a
+    dropped connection is raised, not replayed.
+    """
+    with _send(url, headers, body) as response:
+        for line in response.iter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                return
+            if data:
+                yield json.loads(data)
+
+
+class _send:
+    """
+    Context manager around a streamed POST, with retries on connection
+    errors, timeouts and retryable statuses.
+    """
+
+    def __init__(self, url: str, headers: dict, body: dict):
+        self.url = url
+        self.headers = headers
+        self.body = body
+        self.response = None
+
+    def __enter__(self):
+        import httpx
+        client = shared_client()
+        for attempt in range(MAX_RETRIES + 1):
+            last = attempt == MAX_RETRIES
+            try:
+                request = client.build_request("POST", self.url, headers=self.headers, json=self.body)
+                response = client.send(request, stream=True)
+            except httpx.TransportError as e:
+                if last:
+                    raise APIError(f"{type(e).__name__} calling {self.url}: {e}") from e
+                _backoff(attempt)
+                continue
+
+            if response.status_code < 400:
+                self.response = response
+                return response
+
+            response.read()
+            response.close()
+            if last or response.status_code not in _RETRY_STATUSES:
+                raise APIError(f"HTTP {response.status_code} from {self.url}: {response.text[:500]}",
+                               response.status_code)
+            _backoff(attempt, response.headers.get("retry-after"))
+
+    def __exit__(self, *exc):
+        if self.response is not None:
+            self.response.close()
+
+
+def _backoff(attempt: int, retry_after: str = None):
+    delay = RETRY_BACKOFF * (2 ** attempt)
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            pass
+    time.sleep(delay)
+
+
+class ChatCompletionsClient:
+    """
+    OpenAI-compatible /chat/completions (Groq, DeepSeek).
+    client.chat.completions.create(model=..., messages=..., **params) returns
+    an object with .choices[0].message.content, or with stream=True an
+    iterator of chunks with .choices[0].delta.content, like the SDKs.
+    """
+
+    def __init__(self, api_key: str, base_url: str):
+        self._url = base_url.rstrip("/") + "/chat/completions"
+        self._headers = {"Authorization": f"Bearer {api_key}"}
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, stream: bool = False, **params):
+        if stream:
+            return self._stream(params)
+        data = post_json(self._url, self._headers, params)
+        return _namespace(data)
+
+    def _stream(self, params):
+        for event in stream_events(self._url, self._headers, dict(params, stream=True)):
+            yield _namespace(event)
+
+
+class GeminiModel:
+    """
+    Gemini generateContent over REST.
+    generate_content(parts) returns an object with .text; with stream=True,
+    an iterator of chunks with .text, like google.generativeai.
+    """
+
+    # google.generativeai's snake_case config -> the REST API's camelCase
+    _CONFIG_KEYS = {
+        "temperature": "temperature",
+        "top_p": "topP",
+        "top_k": "topK",
+        "max_output_tokens": "maxOutputTokens",
+        "response_mime_type": "responseMimeType",
+    }
+
+    def __init__(self, api_key: str, base_url: str, model_name: str, generation_config: dict):
+        self._url = f"{base_url.rstrip('/')}/models/{model_name}"
+        self._headers = {"x-goog-api-key": api_key}
+        self._config = {self._CONFIG_KEYS.get(k, k): v for k, v in generation_config.items()}
+
+    def generate_content(self, contents, stream: bool = False):
+        if isinstance(contents, str):
+            contents = [contents]
+        body = {
+            "contents": [{"role": "user", "parts": [{"text": text} for text in contents]}],
+            "generationConfig": self._config,
+        }
+        if stream:
+            return self._stream(body)
+        return SimpleNamespace(text=_gemini_text(post_json(f"{self._url}:generateContent", self._headers, body)))
+
+    def _stream(self, body):
+        url = f"{self._url}:streamGenerateContent?alt=sse"
+        for event in stream_events(url, self._headers, body):
+            yield SimpleNamespace(text=_gemini_text(event))
+
+
+def _gemini_text(data: dict) -> str:
+    candidates = data.get("candidates") or []
+    if not candidates:
+        raise APIError(f"Gemini returned no candidates: {json.dumps(data)[:500]}")
+    parts = candidates[0].get("content", {}).get("parts", [])
+    return "".join(part.get("text", "") for part in parts)
+
+
+def _namespace(value):
+    # JSON -> attribute access, matching the SDK response objects we read
+    if isinstance(value, dict):
+        return SimpleNamespace(**{k: _namespace(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return [_namespace(v) for v in value]
+    return value
@@ -0,0 +1,149 @@
+import json
+import threading
+
+# How model output was recovered; "repaired" is a DeepSeek call saved
+_stats = {"parsed": 0, "repaired": 0, "failed": 0}
+_lock = threading.Lock()
+
+# What may follow the closing quote of a JSON string (after whitespace)
+_AFTER_STRING = ',:}]'
+
+
+def loads(text: str, parse=json.loads, check=None):
+    """
+    json.loads that survives the ways models break JSON: Markdown fences or
+    prose around the object, trailing commas, raw newlines and unescaped
+    quotes inside strings, and output cut off mid-way (the incomplete tail is
+    dropped and open containers are closed).
+    `parse` is tried on the text as-is first, then on the repaired text; a
+    validating parser (e.g. schemas.packet_from_json) works too. `check`,
+    if given, must accept the repaired value: the quote guesses can produce
+    valid JSON with the wrong strings in it.
+    Raises the first attempt's error when even the repaired text fails.
+    """
+    try:
+        value = parse(text)
+        _count("parsed")
+        return value
+    except ValueError as e:
+        error = e
+
+    try:
+        value = parse(repair(text))
+    except ValueError:
+        _count("failed")
+        raise error
+    if check is not None and not check(value):
+        _count("failed")
+        raise error
+    _count("repaired")
+    return value
+
+
+def repair(text: str) -> str:
+    """
+    Best-effort valid JSON for the first object or array in `text`.
+    """
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        return text
+
+    out = []
+    stack = []
+    # Output length and open containers after the last complete value, so a
+    # truncated tail can be cut off cleanly
+    checkpoint = (0, [])
+    in_string = False
+    escaped = False
+    i = start
+    n = len(text)
+
+    while i < n and (stack or not out):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+                out.append(ch)
+            elif ch == "\\":
+                escaped = True
+                out.append(ch)
+            elif ch == '"':
+                j = i + 1
+                while j < n and text[j] in " \t\r\n":
+                    j += 1
+                if j == n or (text[j] in _AFTER_STRING and _closes(text[j], stack)):
+                    in_string = False
+                    out.append(ch)
+                    if j == n or text[j] != ":":
+                        # A value, not a key
+                        checkpoint = (len(out), list(stack))
+                else:
+                    # A quote the model forgot to escape
+                    out.append('\\"')
+            elif ch == "\n":
+                out.append("\\n")
+            elif ch == "\t":
+                out.append("\\t")
+            else:
+                out.append(ch)
+        elif ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+        elif ch in "}]":
+            _drop_trailing_comma(out)
+            if stack:
+                out.append(stack.pop())
+                checkpoint = (len(out), list(stack))
+        elif ch == "`":
+            # A closing fence right after the object
+            break
+        else:
+            out.append(ch)
+        i += 1
+
+    if (stack or in_string) and _truncated(text, start):
+        # Cut off mid-value: keep everything up to the last complete value
+        length, stack = checkpoint
+        out = out[:length]
+        out.extend(reversed(stack))
+    return "".join(out)
+
+
+def _truncated(text: str, start: int) -> bool:
+    # Output that ends in a closing bracket or fence was finished; anything
+    # still open there is a misread quote, and cutting it off would keep a
+    # mangled string
+    return "```" not in text[start:] and not text.rstrip().endswith(("}", "]"))
+
+
+def _closes(follower: str, stack: list) -> bool:
+    # A quote followed by "]" only ends a string inside an array, and so on
+    if follower == ",":
+        return bool(stack)
+    if follower == ":":
+        return bool(stack) and stack[-1] == "}"
+    return bool(stack) and stack[-1] == follower
+
+
+def _drop_trailing_comma(out: list):
+    j = len(out) - 1
+    while j >= 0 and out[j] in (" ", "\t", "\r", "\n"):
+        j -= 1
+    if j >= 0 and out[j] == ",":
+        del out[j]
+
+
+def get_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+    total = sum(stats.values())
+    stats["repair_rate"] = (stats["repaired"] / total) if total else 0.0
+    return stats
+
+
+def _count(outcome: str):
+    with _lock:
+        _stats[outcome] += 1
@@ -0,0 +1,126 @@
+import os
+import time
+import threading
+from collections import defaultdict
+
+# How long a dynamodb backend's counts for one category are reused before
+# they are read again
+READ_TTL_SECONDS = float(os.getenv("PASS_RATE_READ_TTL_SECONDS", "60"))
+
+
+class MemoryBackend:
+    """
+    Counts for this warm Lambda only.
+    """
+
+    def __init__(self):
+        self._counts = defaultdict(lambda: [0, 0])
+        self._lock = threading.Lock()
+
+    def add(self, category: str, bucket: str, passes: int, trials: int):
+        with self._lock:
+            counts = self._counts[(category, bucket)]
+            counts[0] += passes
+            counts[1] += trials
+
+    def counts(self, category: str) -> dict:
+        with self._lock:
+            return {bucket: tuple(c) for (cat, bucket), c in self._counts.items() if cat == category}
+
+
+class DynamoDBBackend:
+    """
+    Shared across all controller instances: one item per (category, bucket),
+    incremented atomically. Reads are cached per category for READ_TTL_SECONDS.
+    """
+
+    def __init__(self, table_name: str, read_ttl: float = READ_TTL_SECONDS):
+        import boto3
+        self._table = boto3.resource("dynamodb").Table(table_name)
+        self._read_ttl = read_ttl
+        self._cached = {}
+        self._lock = threading.Lock()
+
+    def add(self, category: str, bucket: str, passes: int, trials: int):
+        self._table.update_item(
+            Key={"category": category, "bucket": bucket},
+            UpdateExpression="ADD passes :p, trials :t",
+            ExpressionAttributeValues={":p": passes, ":t": trials},
+        )
+
+    def counts(self, category: str) -> dict:
+        with self._lock:
+            cached = self._cached.get(category)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        response = self._table.query(
+            KeyConditionExpression="category = :c",
+            ExpressionAttributeValues={":c": category},
+        )
+        counts = {item["bucket"]: (int(item.get("passes", 0)), int(item.get("trials", 0)))
+                  for item in response.get("Items", [])}
+        with self._lock:
+            self._cached[category] = (time.monotonic() + self._read_ttl, counts)
+        return counts
+
+
+class PassRates:
+    """
+    How often verified candidates passed the sandbox, per error category and
+    bucket (a label the caller picks, e.g. ranker features). Backend errors
+    are logged; reads then return no history.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.errors = 0
+
+    def record(self, category: str, bucket: str, passes: int, trials: int):
+        if self.backend is None or trials <= 0:
+            return
+        try:
+            self.backend.add(category, bucket, passes, trials)
+        except Exception as e:
+            print(f"Pass rate write failed: {e}")
+            self.errors += 1
+
+    def counts(self, category: str) -> dict:
+        """
+        {bucket: (passes, trials)} for one category.
+        """
+        if self.backend is None:
+            return {}
+        try:
+            return self.backend.counts(category)
+        except Exception as e:
+            print(f"Pass rate read failed: {e}")
+            self.errors += 1
+            return {}
+
+
+def smoothed(counts, prior: float, weight: float) -> float:
+    """
+    The observed pass rate pulled towards `prior`, as if `weight` trials had
+    already passed at that rate; with no history it is the prior.
+    """
+    passes, trials = counts or (0, 0)
+    return (passes + prior * weight) / (trials + weight)
+
+
+def from_env() -> PassRates:
+    """
+    PASS_RATE_BACKEND: memory (default) | dynamodb | off
+    """
+    kind = os.getenv("PASS_RATE_BACKEND", "memory").lower()
+    try:
+        if kind == "memory":
+            backend = MemoryBackend()
+        elif kind == "dynamodb":
+            backend = DynamoDBBackend(os.getenv("PASS_RATE_TABLE", "PVE_PassRates"))
+        else:
+            backend = None
+    except Exception as e:
+        print(f"Pass rates disabled, backend '{kind}' failed to start: {e}")
+        backend = None
+
+    return PassRates(backend)
@@ -0,0 +1,102 @@
+import re
+import ast
+
+FULL = "full"
+DIFF = "diff"
+
+# Shared by the Gemini and DeepSeek prompts in DIFF mode
+DIFF_INSTRUCTIONS = (
+    "Each candidate must be a unified diff against the code you were given "
+    "(--- a/code.py, +++ b/code.py, then @@ hunks with 3 lines of context), "
+    "not the full file."
+)
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+class PatchError(ValueError):
+    """
+    Raised when a candidate diff is malformed or its context isn't in the code.
+    """
+
+
+class Hunk:
+    def __init__(self, old_start: int):
+        self.old_start = old_start
+        self.old = []
+        self.new = []
+
+
+def is_patch(candidate: str) -> bool:
+    """
+    True when the candidate is a unified diff rather than a full file.
+    """
+    for line in candidate.lstrip().splitlines():
+        if line.startswith(("--- ", "+++ ", "diff ", "index ")):
+            continue
+        return bool(_HUNK_HEADER.match(line))
+    return False
+
+
+def parse_hunks(diff: str) -> list:
+    hunks = []
+    for line in diff.rstrip("\n").splitlines():
+        header = _HUNK_HEADER.match(line)
+        if header:
+            hunks.append(Hunk(int(header.group(1))))
+        elif not hunks or line.startswith("\\"):
+            # File headers before the first hunk, "\ No newline at end of file"
+            continue
+        elif line.startswith("-"):
+            hunks[-1].old.append(line[1:])
+        elif line.startswith("+"):
+            hunks[-1].new.append(line[1:])
+        elif line.startswith(" ") or line == "":
+            # Models often drop the leading space on blank context lines
+            hunks[-1].old.append(line[1:])
+            hunks[-1].new.append(line[1:])
+        else:
+            raise PatchError(f"Unexpected line in hunk: {line!r}")
+    if not hunks:
+        raise PatchError("No hunks in diff")
+    return hunks
+
+
+def apply_patch(original: str, diff: str) -> str:
+    """
+    Applies a unified diff to `original`. Hunk line numbers are only a hint:
+    each hunk's context is matched exactly (ignoring trailing whitespace) at
+    the nearest position at or after the previous hunk.
+    Raises PatchError when a hunk's context can't be found or the patched
+    code isn't valid Python.
+    """
+    lines = original.splitlines()
+    stripped = [line.rstrip() for line in lines]
+    out = []
+    pos = 0
+    for hunk in parse_hunks(diff):
+        at = _locate(stripped, hunk.old, hunk.old_start - 1, pos)
+        if at is None:
+            raise PatchError(f"Hunk at line {hunk.old_start} does not match the code")
+        out.extend(lines[pos:at])
+        out.extend(hunk.new)
+        pos = at + len(hunk.old)
+    out.extend(lines[pos:])
+    patched = "\n".join(out) + "\n"
+    try:
+        ast.parse(patched)
+    except (SyntaxError, ValueError) as e:
+        raise PatchError(f"Patched code does not parse: {e}") from e
+    return patched
+
+
+def _locate(stripped: list, old: list, expected: int, start: int):
+    if not old:
+        # Pure insertion: trust the header
+        return min(max(expected + 1, start), len(stripped))
+    wanted = [line.rstrip() for line in old]
+    positions = range(start, len(stripped) - len(wanted) + 1)
+    for at in sorted(positions, key=lambda p: abs(p - expected)):
+        if stripped[at] == wanted[0] and stripped[at:at + len(wanted)] == wanted:
+            return at
+    return None
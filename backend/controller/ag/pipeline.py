@@ -0,0 +1,375 @@
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from . import categorizer, brain, fallback, hedging, fixcache, slicer, patches, breaker, singleflight, templates, streaming, ranker, sizing
+
+# How long a speculative generation waits for Llama before it is committed to.
+# Classification arriving within this budget restarts generation with the
+# category-specific prompt; anything later is too late to be worth it.
+CLASSIFY_BUDGET = float(os.getenv("CLASSIFY_BUDGET_SECONDS", "0.5"))
+
+# Hedging: once Gemini is slower than its own p<HEDGE_PERCENTILE> latency,
+# DeepSeek is fired alongside it. Until HEDGE_MIN_SAMPLES calls have been
+# seen, HEDGE_DEFAULT_DELAY seconds is used instead.
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY_SECONDS", "10"))
+
+brain_latency = hedging.LatencyTracker()
+
+# "full" asks the models for whole files; "diff" for unified diffs, which are
+# applied here (output grows with the fix, not the file). When no diff in a
+# packet applies, generation is retried in "full" mode.
+CANDIDATE_FORMAT = os.getenv("CANDIDATE_FORMAT", patches.FULL).lower()
+
+# Finished packets keyed on normalized (code, traceback); see fixcache.from_env()
+fix_cache = fixcache.from_env()
+
+# Identical requests in flight at the same time share one generation. Across
+# instances this needs a shared fix cache (dynamodb): a follower polls it every
+# SINGLEFLIGHT_POLL_SECONDS for up to SINGLEFLIGHT_WAIT_SECONDS, then
+# generates on its own.
+inflight = singleflight.Group()
+SINGLEFLIGHT_WAIT = float(os.getenv("SINGLEFLIGHT_WAIT_SECONDS", "25"))
+SINGLEFLIGHT_POLL = float(os.getenv("SINGLEFLIGHT_POLL_SECONDS", "0.5"))
+
+# Template fixes (ag.templates) are tried before any model is called.
+# "verified": only with a sandbox verifier; a template packet is returned when
+# one of its candidates passes and the original code fails the same script.
+# "trust": returned unverified (Step Functions still verifies). "off": never.
+TEMPLATE_FIXES = os.getenv("TEMPLATE_FIXES", "verified").lower()
+TEMPLATE_SOURCE = "Templates"
+
+# Error type given to the prompt while the real category is still unknown
+GENERIC_ERROR_TYPE = "UNCLASSIFIED"
+
+# Provider SDK calls block. They run on this private pool rather than asyncio's
+# default executor, which asyncio.run() would wait on before returning, so an
+# abandoned speculative call never holds up the response.
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="pve-provider")
+
+
+class GenerationError(Exception):
+    """
+    Raised when every AI model failed to generate a fix.
+    """
+
+
+async def run(code: str, error_log: str, verifier=None) -> dict:
+    """
+    Categorizes the error and generates a FixPacket.
+    When the local rules can't classify the error, Llama and a speculative
+    generic-prompt generation run side by side.
+    With a streaming.StreamingVerifier, Gemini's response is streamed and each
+    candidate goes to the sandbox as soon as it is complete; the results come
+    back as "verification_results".
+    Large files are cut down to the slice the traceback points at (see
+    slicer.slice_code) before any model sees them; candidates are spliced
+    back into the full file before they are verified or returned.
+    A request identical (after fixcache normalization) to one already in
+    flight waits for that one's packet instead of generating its own.
+    Textbook errors are first tried with template rewrites (ag.templates);
+    the models are only called when none of those passes the sandbox.
+    Returns {"result", "source", "error_type", "timings"}.
+    """
+    timings = {}
+    t0 = time.perf_counter()
+
+    cached = fix_cache.get(code, error_log)
+    reused = "cached"
+    if cached is None:
+        key = fixcache.cache_key(code, error_log)
+        outcome, shared = await inflight.do(key, lambda: _lead(code, error_log, verifier, timings, t0))
+        if not shared and outcome.get("timings") is timings:
+            return outcome
+        # Generated for another request, in this process or another instance
+        cached, reused = outcome, "coalesced"
+
+    outcome = {
+        "result": cached["result"],
+        "source": f"{cached['source']} ({reused})",
+        "error_type": cached["error_type"],
+        "timings": timings
+    }
+    if verifier is not None:
+        outcome["verification_results"] = await _in_thread(verifier.finish, cached["result"])
+    timings["total"] = time.perf_counter() - t0
+    timings["cached"] = reused == "cached"
+    timings["coalesced"] = reused == "coalesced"
+    return outcome
+
+
+async def _lead(code: str, error_log: str, verifier, timings: dict, t0: float) -> dict:
+    # This process's flight. Generates, unless another instance holds the
+    # claim: then its packet is awaited in the shared fix cache (without the
+    # "timings" of an outcome generated here).
+    deadline = time.monotonic() + SINGLEFLIGHT_WAIT
+    while not fix_cache.claim(code, error_log, SINGLEFLIGHT_WAIT):
+        if time.monotonic() >= deadline:
+            print("Claim holder too slow. Generating anyway...")
+            break
+        await asyncio.sleep(SINGLEFLIGHT_POLL)
+        cached = fix_cache.get(code, error_log)
+        if cached is not None:
+            inflight.count_remote()
+            return cached
+
+    try:
+        return await _generate_outcome(code, error_log, verifier, timings, t0)
+    finally:
+        fix_cache.release(code, error_log)
+
+
+async def _generate_outcome(code: str, error_log: str, verifier, timings: dict, t0: float) -> dict:
+    result = await _template_fix(code, error_log, verifier, timings)
+    if result is not None:
+        source, speculative_used = TEMPLATE_SOURCE, False
+        error_type = categorizer.classify_fast(code, error_log) or "RUNTIME"
+    else:
+        result, source, error_type, speculative_used = await _model_fix(code, error_log, verifier, timings, t0)
+
+    verification_results = None
+    reproduced = None
+    if verifier is not None:
+        t_verify = time.perf_counter()
+        verification_results = await _in_thread(verifier.finish, result)
+        reproduced = await _in_thread(verifier.reproduces, result["reproduction_script"])
+        # Only the tail: most runs overlapped with generation
+        timings["verify_tail"] = time.perf_counter() - t_verify
+
+    timings["total"] = time.perf_counter() - t0
+    timings["speculative"] = speculative_used
+    timings["cached"] = False
+    timings["coalesced"] = False
+    print(f"Stage timings: {timings}")
+
+    outcome = {
+        "result": result,
+        "source": source,
+        "error_type": error_type,
+        "timings": timings
+    }
+    if verification_results is not None:
+        outcome["verification_results"] = verification_results
+    if reproduced is not None:
+        outcome["reproduced"] = reproduced
+    # Model candidates' outcomes teach the ranker and the candidate count
+    # (template packets only keep their passing candidates)
+    if verification_results is not None and reproduced is not False and source != TEMPLATE_SOURCE:
+        ranker.record(result["candidates"], code, error_log, error_type, verification_results)
+        sizing.record(error_type, verification_results)
+    # A script the original passes makes the packet worthless; don't keep it
+    if is_valid_packet(result) and reproduced is not False:
+        fix_cache.put(code, error_log, {"result": result, "source": source, "error_type": error_type})
+    return outcome
+
+
+async def _template_fix(code: str, error_log: str, verifier, timings: dict):
+    # A template packet worth returning, or None to ask the models
+    if TEMPLATE_FIXES not in ("verified", "trust"):
+        return None
+    if TEMPLATE_FIXES == "verified" and verifier is None:
+        return None
+
+    t0 = time.perf_counter()
+    packet = templates.generate(code, error_log)
+    timings["templates"] = time.perf_counter() - t0
+    if packet is None or verifier is None:
+        return packet
+
+    # The original runs alongside (see StreamingVerifier): templates are only
+    # trusted when it fails the script
+    script = packet["reproduction_script"]
+    results = await _in_thread(verifier.check, script, packet["candidates"])
+    reproduced = await _in_thread(verifier.reproduces, script)
+    timings["templates"] = time.perf_counter() - t0
+    passing = [c for c, r in zip(packet["candidates"], results) if streaming.passed(r)]
+    print(f"Template candidates: {len(passing)} of {len(results)} passed")
+    if not reproduced or not passing:
+        return None
+    return {**packet, "candidates": passing}
+
+
+async def _model_fix(code: str, error_log: str, verifier, timings: dict, t0: float):
+    # Slice, classify and generate with the models.
+    # Returns (packet, source, error_type, speculative_used).
+    code_slice = slicer.slice_code(code, error_log)
+    prompt_code, prompt_log = code, error_log
+    if code_slice is not None:
+        prompt_code, prompt_log = code_slice.code, code_slice.error_log
+        print(f"Sliced code: {code_slice.original_lines} -> {code_slice.sliced_lines} lines")
+    timings["slice"] = time.perf_counter() - t0
+    timings["sliced"] = code_slice is not None
+
+    error_type = categorizer.classify_fast(prompt_code, prompt_log)
+    speculative_used = False
+
+    if error_type:
+        timings["classify"] = time.perf_counter() - t0
+        t_generate = time.perf_counter()
+        generation = generate(prompt_code, prompt_log, error_type, verifier, code_slice)
+    else:
+        classification = asyncio.ensure_future(_in_thread(categorizer.classify_error, prompt_code, prompt_log))
+        classification.add_done_callback(
+            lambda _: timings.setdefault("classify", time.perf_counter() - t0))
+        speculative = asyncio.ensure_future(
+            generate(prompt_code, prompt_log, GENERIC_ERROR_TYPE, verifier, code_slice))
+
+        await asyncio.wait({classification}, timeout=CLASSIFY_BUDGET)
+        if classification.done() and not classification.result().startswith("UNKNOWN"):
+            speculative.cancel()
+            t_generate = time.perf_counter()
+            generation = generate(prompt_code, prompt_log, classification.result(), verifier, code_slice)
+        else:
+            speculative_used = True
+            t_generate = t0
+            generation = speculative
+
+    result, source = await generation
+    timings["generate"] = time.perf_counter() - t_generate
+
+    if not error_type:
+        error_type = await classification
+    return result, source, error_type, speculative_used
+
+
+async def generate(code: str, error_log: str, error_type: str, verifier=None, code_slice=None,
+                   candidate_format: str = None, candidate_count: int = None):
+    """
+    Gemini, hedged with DeepSeek when Gemini is slow or fails.
+    Asks for candidate_count candidates (default: sizing.candidate_count for
+    the error type) and keeps no more than that.
+    While Gemini's circuit is open (see ag.breaker) DeepSeek is called
+    straight away; while DeepSeek's is, it is only tried once Gemini failed.
+    With a code_slice, `code` is the slice and the candidates are spliced
+    back into the full file; diff candidates are applied first.
+    Returns (FixPacket dict, source name).
+    """
+    candidate_format = candidate_format or CANDIDATE_FORMAT
+    candidate_count = candidate_count or sizing.candidate_count(error_type)
+    print(f"Requesting {candidate_count} candidate(s) for {error_type}")
+
+    streams = []
+
+    def primary():
+        print("Attempting generation with Gemini...")
+        on_event = None
+        if verifier is not None:
+            streams.append(verifier.stream())
+            on_event = _full_file_events(streams[-1], code, code_slice, candidate_count)
+        return _in_thread(_timed_brain, code, error_log, error_type, on_event, candidate_format, candidate_count)
+
+    def secondary():
+        print("Gemini slow or failed. Hedging with DeepSeek...")
+        return _in_thread(_timed_fallback, code, error_log, error_type, candidate_format, candidate_count)
+
+    delay = hedging.hedge_delay(brain_latency, HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES, HEDGE_DEFAULT_DELAY)
+    gemini_up = breaker.for_provider("gemini").allow()
+    deepseek_up = breaker.for_provider("deepseek").state == breaker.CLOSED
+    winner = None
+    try:
+        if not gemini_up and breaker.for_provider("deepseek").allow():
+            print("Gemini circuit open. Going straight to DeepSeek...")
+            result, winner = await secondary(), 1
+        else:
+            # With both circuits open Gemini is tried anyway, as the probe
+            result, winner = await hedging.hedged(primary, secondary, delay if deepseek_up else None,
+                                                  is_valid_packet)
+    except Exception as e:
+        print(f"Gemini and DeepSeek failed: {e}")
+        raise GenerationError("All AI models failed to generate a fix.") from e
+    finally:
+        # A Gemini stream that lost the hedge, or whose generation was
+        # cancelled (speculation), keeps running in its thread: stop it
+        # from taking sandbox slots
+        if winner != 0:
+            for stream in streams:
+                stream.close()
+
+    if is_valid_packet(result):
+        result = _full_files({**result, "candidates": result["candidates"][:candidate_count]}, code, code_slice)
+        if not result["candidates"] and candidate_format != patches.FULL:
+            print("No candidate patch applied. Regenerating full files...")
+            return await generate(code, error_log, error_type, verifier, code_slice, patches.FULL, candidate_count)
+    return result, ("Gemini 1.5 Flash", "DeepSeek V3")[winner]
+
+
+def full_file(candidate: str, prompt_code: str, code_slice=None) -> str:
+    """
+    The complete file a candidate stands for: a diff is applied to the code
+    the model was shown, and a slice is spliced back into the original.
+    Raises patches.PatchError when a diff doesn't apply.
+    """
+    if patches.is_patch(candidate):
+        candidate = patches.apply_patch(prompt_code, candidate)
+    if code_slice is not None:
+        candidate = code_slice.splice(candidate)
+    return candidate
+
+
+def _full_files(packet: dict, prompt_code: str, code_slice) -> dict:
+    candidates = []
+    for candidate in packet["candidates"]:
+        try:
+            candidates.append(full_file(candidate, prompt_code, code_slice))
+        except patches.PatchError as e:
+            print(f"Dropping candidate: {e}")
+    return {**packet, "candidates": candidates}
+
+
+def _full_file_events(on_event, prompt_code: str, code_slice, candidate_count: int):
+    # Streamed candidates go to the sandbox as full files; ones that don't
+    # apply, or that the model added beyond candidate_count, never do
+    def wrapped(kind, index, value):
+        if kind == "candidate":
+            if index >= candidate_count:
+                return
+            try:
+                value = full_file(value, prompt_code, code_slice)
+            except patches.PatchError:
+                return
+        on_event(kind, index, value)
+    return wrapped
+
+
+def is_valid_packet(packet: dict) -> bool:
+    """
+    A packet worth returning: has candidates and isn't DeepSeek's failure stub.
+    """
+    return bool(packet.get("candidates")) and packet != fallback.FAILED_PACKET
+
+
+def _timed_brain(code: str, error_log: str, error_type: str, on_event=None,
+                 candidate_format: str = patches.FULL, candidate_count: int = 3) -> dict:
+    # Timed in the worker thread, so calls that lose a hedge still count
+    t0 = time.perf_counter()
+    packet = None
+    try:
+        if on_event is not None:
+            packet = brain.stream_fix_packet(code, error_log, error_type, on_event, candidate_format, candidate_count)
+        else:
+            packet = brain.generate_fix_packet(code, error_log, error_type, candidate_format, candidate_count)
+    finally:
+        elapsed = time.perf_counter() - t0
+        breaker.for_provider("gemini").record(packet is not None and is_valid_packet(packet), elapsed)
+    brain_latency.record(elapsed)
+    return packet
+
+
+def _timed_fallback(code: str, error_log: str, error_type: str, candidate_format: str = patches.FULL,
+                    candidate_count: int = 3) -> dict:
+    # DeepSeek reports failure with FAILED_PACKET rather than raising
+    t0 = time.perf_counter()
+    packet = None
+    try:
+        packet = fallback.generate_fix_packet(code, error_log, error_type, candidate_format, candidate_count)
+    finally:
+        breaker.for_provider("deepseek").record(packet is not None and is_valid_packet(packet),
+                                                time.perf_counter() - t0)
+    return packet
+
+
+async def _in_thread(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, func, *args)
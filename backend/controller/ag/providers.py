@@ -0,0 +1,133 @@
+import os
+import sys
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# One client per (provider, key) per process. Warm Lambda invocations reuse
+# them, and with them the SDKs' keep-alive connection pools, instead of
+# paying client setup and a fresh TLS handshake on every request.
+_registry = {}
+_lock = threading.Lock()
+
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+GROQ_BASE_URL = "https://api.groq.com/openai/v1"
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+GEMINI_MODEL = "gemini-1.5-flash-latest"
+
+# "sdk": the vendor SDKs. "http": the thin ag.httpapi adapters on one shared
+# httpx client, so the SDKs need not be packaged at all.
+SDK = "sdk"
+HTTP = "http"
+
+
+def transport() -> str:
+    # Read per call so tests (and a redeploy's env) can switch it
+    return os.getenv("PROVIDER_TRANSPORT", SDK).lower()
+
+
+def _get_or_create(name: str, api_key: str, factory):
+    key = (transport(), name, api_key)
+    client = _registry.get(key)
+    if client is None:
+        with _lock:
+            client = _registry.get(key)
+            if client is None:
+                client = factory()
+                _registry[key] = client
+    return client
+
+
+def groq_client():
+    """
+    Shared Groq client, or None when GROQ_API_KEY is not set.
+    """
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        return None
+
+    def create():
+        if transport() == HTTP:
+            from .httpapi import ChatCompletionsClient
+            return ChatCompletionsClient(api_key, os.getenv("GROQ_BASE_URL", GROQ_BASE_URL))
+        from groq import Groq
+        return Groq(api_key=api_key)
+
+    return _get_or_create("groq", api_key, create)
+
+
+def deepseek_client():
+    """
+    Shared OpenAI-compatible client for DeepSeek.
+    """
+    api_key = os.getenv("DEEPSEEK_API_KEY")
+    if not api_key:
+        raise ValueError("Missing DEEPSEEK_API_KEY")
+
+    base_url = os.getenv("DEEPSEEK_BASE_URL", DEEPSEEK_BASE_URL)
+
+    def create():
+        if transport() == HTTP:
+            from .httpapi import ChatCompletionsClient
+            return ChatCompletionsClient(api_key, base_url)
+        from openai import OpenAI
+        return OpenAI(api_key=api_key, base_url=base_url)
+
+    return _get_or_create("deepseek", api_key, create)
+
+
+def gemini_model(generation_config: dict):
+    """
+    Shared Gemini model for the given config. genai.configure() resets the
+    SDK's transport, so it runs once per key rather than once per request.
+    """
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("Missing GEMINI_API_KEY")
+    config_key = tuple(sorted(generation_config.items()))
+
+    if transport() == HTTP:
+        def create_http():
+            from .httpapi import GeminiModel
+            return GeminiModel(api_key, os.getenv("GEMINI_BASE_URL", GEMINI_BASE_URL),
+                               GEMINI_MODEL, generation_config)
+
+        return _get_or_create(("gemini-model", config_key), api_key, create_http)
+
+    def configure():
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        return genai
+
+    genai = _get_or_create("gemini", api_key, configure)
+
+    def create():
+        return genai.GenerativeModel(
+            model_name=GEMINI_MODEL,
+            generation_config=generation_config,
+        )
+
+    return _get_or_create(("gemini-model", config_key), api_key, create)
+
+
+def lambda_client():
+    """
+    Shared boto3 Lambda client (credentials come from the execution role).
+    """
+    def create():
+        import boto3
+        return boto3.client("lambda")
+
+    return _get_or_create("lambda", None, create)
+
+
+def reset():
+    """
+    Drops every cached client (tests, key rotation).
+    """
+    with _lock:
+        _registry.clear()
+    httpapi = sys.modules.get(f"{__package__}.httpapi")
+    if httpapi is not None:
+        httpapi.reset()
@@ -0,0 +1,160 @@
+import os
+import ast
+import difflib
+import threading
+from . import slicer, passrates, streaming
+
+# Edits within this many lines of a traceback frame count as touching it
+TOUCH_WINDOW = int(os.getenv("RANKER_TOUCH_WINDOW", "2"))
+# How many trials the built-in priors are worth against recorded history:
+# a bucket's own pass rate takes over once it has seen more than this
+PRIOR_WEIGHT = float(os.getenv("RANKER_PRIOR_WEIGHT", "10"))
+
+# Changed lines (per side, whichever is larger) up to which a diff is small/medium
+SMALL_LINES = 3
+MEDIUM_LINES = 15
+
+# Built-in pass-rate guesses per bucket, before any history: fixes at the
+# failing line beat fixes further up the stack, which beat edits elsewhere;
+# small diffs beat large rewrites
+_TOUCH_PRIOR = {"line": 0.6, "stack": 0.45, "untraced": 0.45, "elsewhere": 0.25}
+_SIZE_ADJUST = {"small": 0.1, "medium": 0.0, "large": -0.15}
+_UNCHANGED_PRIOR = 0.02
+
+# Verified outcomes per (error category, bucket); see passrates.from_env()
+history = passrates.from_env()
+
+_stats = {"ranked": 0, "reordered": 0, "recorded": 0}
+_stats_lock = threading.Lock()
+
+
+def features(candidate: str, code: str, error_log: str) -> dict:
+    """
+    Cheap, local facts about one full-file candidate against the original:
+    whether it parses, how many lines it changes, and whether the change is
+    at the traceback's failing line ("line"), another frame of the user's
+    code ("stack"), elsewhere, or "untraced" when no frame points into it.
+    "bucket" combines them into the key pass rates are kept under.
+    """
+    try:
+        ast.parse(candidate)
+    except (SyntaxError, ValueError):
+        return {"parses": False, "changed_lines": None, "touches": None, "bucket": "invalid"}
+
+    original = code.splitlines()
+    spans = _changed_spans(original, candidate.splitlines())
+    changed = sum(size for _, _, size in spans)
+    if not changed:
+        return {"parses": True, "changed_lines": 0, "touches": None, "bucket": "unchanged"}
+
+    frames = slicer.traceback_lines(error_log, len(original))
+    if not frames:
+        touches = "untraced"
+    elif _near(spans, frames[-1]):
+        touches = "line"
+    elif any(_near(spans, line) for line in frames[:-1]):
+        touches = "stack"
+    else:
+        touches = "elsewhere"
+
+    if changed <= SMALL_LINES:
+        size = "small"
+    elif changed <= MEDIUM_LINES:
+        size = "medium"
+    else:
+        size = "large"
+    return {"parses": True, "changed_lines": changed, "touches": touches, "bucket": f"{touches}/{size}"}
+
+
+def prior(bucket: str) -> float:
+    """
+    The built-in pass-rate guess for a bucket.
+    """
+    if bucket == "invalid":
+        return 0.0
+    if bucket == "unchanged":
+        return _UNCHANGED_PRIOR
+    touches, size = bucket.split("/")
+    return _TOUCH_PRIOR[touches] + _SIZE_ADJUST[size]
+
+
+def score(bucket: str, counts: dict) -> float:
+    """
+    Expected pass rate of a candidate in `bucket`, given the category's
+    recorded {bucket: (passes, trials)}. Candidates that don't parse score 0.
+    """
+    if bucket == "invalid":
+        return 0.0
+    return passrates.smoothed(counts.get(bucket), prior(bucket), PRIOR_WEIGHT)
+
+
+def rank(candidates: list, code: str, error_log: str, category: str) -> list:
+    """
+    Candidate indices, most likely to pass first, so the sandbox runs them
+    in that order. Ties keep the smaller diff, then the model's order.
+    """
+    counts = history.counts(category)
+    keyed = []
+    for index, candidate in enumerate(candidates):
+        facts = features(candidate, code, error_log)
+        changed = facts["changed_lines"]
+        keyed.append((-score(facts["bucket"], counts), changed if changed is not None else float("inf"), index))
+    order = [index for _, _, index in sorted(keyed)]
+
+    with _stats_lock:
+        _stats["ranked"] += 1
+        if order != sorted(order):
+            _stats["reordered"] += 1
+    return order
+
+
+def record(candidates: list, code: str, error_log: str, category: str, results: list):
+    """
+    Adds verified outcomes (sandbox results, one per candidate) to the
+    category's history. Runs the sandbox couldn't complete don't count.
+    """
+    totals = {}
+    for candidate, result in zip(candidates, results):
+        if result.get("statusCode", 500) >= 500:
+            continue
+        bucket = features(candidate, code, error_log)["bucket"]
+        passes, trials = totals.get(bucket, (0, 0))
+        totals[bucket] = (passes + streaming.passed(result), trials + 1)
+
+    for bucket, (passes, trials) in totals.items():
+        history.record(category, bucket, passes, trials)
+    with _stats_lock:
+        _stats["recorded"] += sum(trials for _, trials in totals.values())
+
+
+def get_stats() -> dict:
+    """
+    Requests ranked, how many of those changed the model's order, and
+    verified outcomes recorded, for this warm container.
+    """
+    with _stats_lock:
+        return dict(_stats, history_errors=history.errors)
+
+
+def _changed_spans(original: list, candidate: list) -> list:
+    # (start, end, changed lines) per edit. Fixes are local: only the part
+    # between the common head and tail is diffed, which keeps this cheap on
+    # long files
+    head = 0
+    limit = min(len(original), len(candidate))
+    while head < limit and original[head] == candidate[head]:
+        head += 1
+    tail = 0
+    while tail < limit - head and original[-1 - tail] == candidate[-1 - tail]:
+        tail += 1
+    matcher = difflib.SequenceMatcher(None, original[head:len(original) - tail],
+                                      candidate[head:len(candidate) - tail], autojunk=False)
+    return [(head + i1, head + i2, max(i2 - i1, j2 - j1))
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"]
+
+
+def _near(spans, line: int) -> bool:
+    # spans: changed (start, end) ranges of the original, 0-based, end
+    # exclusive; an insertion has start == end
+    index = line - 1
+    return any(start - TOUCH_WINDOW <= index <= max(end - 1, start) + TOUCH_WINDOW for start, end, _ in spans)
@@ -1,6 +1,47 @@
-from pydantic import BaseModel
+import ast
+from functools import lru_cache
 from typing import List
+from typing_extensions import TypedDict
 
-class FixPacket(BaseModel):
+
+class FixPacket(TypedDict):
     reproduction_script: str
     candidates: List[str]
+
+
+@lru_cache(maxsize=None)
+def packet_adapter():
+    """
+    The FixPacket validator, compiled once per process on first use.
+    pydantic is imported here rather than at module level: it is the
+    biggest import left in the controller (~150 ms), and paying it in
+    Lambda init slows every cold start, including ones that never parse
+    a model response (bad requests, fix cache hits).
+    """
+    from pydantic import TypeAdapter
+
+    return TypeAdapter(FixPacket)
+
+
+def packet_from_json(data) -> FixPacket:
+    """
+    JSON text or bytes -> validated FixPacket dict (unknown keys dropped).
+    Parsing and validation happen in one pydantic-core pass, with no
+    json.loads -> model -> model_dump round trip.
+    Raises pydantic.ValidationError on bad JSON or a bad shape.
+    """
+    return packet_adapter().validate_json(data)
+
+
+def packet_parses(packet: FixPacket, candidates: bool = True) -> bool:
+    """
+    Whether the reproduction script, and the candidates unless they are
+    diffs (candidates=False), are valid Python.
+    """
+    sources = [packet["reproduction_script"]] + (packet["candidates"] if candidates else [])
+    for source in sources:
+        try:
+            ast.parse(source)
+        except (SyntaxError, ValueError):
+            return False
+    return True
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class Group:
+    """
+    Collapses concurrent calls with the same key into one: the first caller
+    (the leader) runs the work, everyone arriving while it is in flight
+    awaits the same result. Works across threads and their event loops, so
+    concurrent handler invocations in one process share a flight.
+    Nothing is remembered once a flight lands; that is the fix cache's job.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._stats = {"leaders": 0, "coalesced": 0, "remote_coalesced": 0}
+
+    async def do(self, key: str, func):
+        """
+        Awaits func() (a zero-argument callable returning an awaitable), or
+        the flight already running for `key`.
+        Returns (result, shared) with shared=True for followers. The leader's
+        error is raised to its followers too; if the leader is cancelled, a
+        follower takes over.
+        """
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = Future()
+                    self._stats["leaders"] += 1
+                else:
+                    self._stats["coalesced"] += 1
+
+            if not leader:
+                try:
+                    return await asyncio.wrap_future(flight), True
+                except asyncio.CancelledError:
+                    # The leader's own cancellation, not ours: lead instead
+                    if flight.cancelled():
+                        with self._lock:
+                            self._stats["coalesced"] -= 1
+                        continue
+                    raise
+
+            try:
+                result = await func()
+            except asyncio.CancelledError:
+                flight.cancel()
+                raise
+            except BaseException as e:
+                flight.set_exception(e)
+                raise
+            else:
+                flight.set_result(result)
+                return result, False
+            finally:
+                with self._lock:
+                    del self._flights[key]
+
+    def count_remote(self):
+        """
+        A flight that was led by another container (see FixCache.claim).
+        """
+        with self._lock:
+            self._stats["remote_coalesced"] += 1
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+    def stats(self) -> dict:
+        """
+        "coalesced" + "remote_coalesced" is the number of generations (each a
+        Gemini call, plus a Groq call when the rules couldn't classify) that
+        were not made because an identical request was already in flight.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats["collapsed_generations"] = stats["coalesced"] + stats["remote_coalesced"]
+        return stats
@@ -0,0 +1,70 @@
+import os
+import math
+import threading
+from . import passrates, ranker, streaming
+
+# Candidates asked for per category with no history: a syntax error has one
+# obvious fix, a logic error deserves several different attempts
+BASE_COUNTS = {"SYNTAX": 1, "RUNTIME": 3, "SECURITY": 2, "LOGIC": 5}
+DEFAULT_COUNT = 3
+
+MIN_CANDIDATES = int(os.getenv("CANDIDATES_MIN", "1"))
+MAX_CANDIDATES = int(os.getenv("CANDIDATES_MAX", "5"))
+# Ask for enough candidates that at least one passes with this probability,
+# going by how often the model's first candidate passed in the category
+TARGET_PASS_RATE = float(os.getenv("CANDIDATES_TARGET_PASS_RATE", "0.9"))
+# How many verified packets the base counts are worth against history
+PRIOR_WEIGHT = float(os.getenv("CANDIDATES_PRIOR_WEIGHT", "10"))
+
+# Bucket in ranker.history holding first-candidate outcomes; never a ranker
+# bucket, so both share one store
+FIRST_BUCKET = "first-candidate"
+
+_stats = {"requested": 0, "recorded": 0}
+_stats_lock = threading.Lock()
+
+
+def candidate_count(category: str) -> int:
+    """
+    How many candidates to ask the models for. Each category's base count
+    stands for the first-candidate pass rate at which that many candidates
+    reach TARGET_PASS_RATE (treating candidates as independent tries); the
+    recorded rate moves it from there, within CANDIDATES_MIN..CANDIDATES_MAX.
+    """
+    base = min(max(BASE_COUNTS.get(category, DEFAULT_COUNT), MIN_CANDIDATES), MAX_CANDIDATES)
+    miss = 1 - TARGET_PASS_RATE
+    rate = passrates.smoothed(ranker.history.counts(category).get(FIRST_BUCKET),
+                              1 - miss ** (1 / base), PRIOR_WEIGHT)
+    if rate >= 1:
+        count = MIN_CANDIDATES
+    elif rate <= 0:
+        count = MAX_CANDIDATES
+    else:
+        # Rounded so the prior alone gives back the base count exactly
+        count = math.ceil(round(math.log(miss) / math.log(1 - rate), 6))
+    count = min(max(count, MIN_CANDIDATES), MAX_CANDIDATES)
+
+    with _stats_lock:
+        _stats["requested"] += count
+    return count
+
+
+def record(category: str, results: list):
+    """
+    Adds whether the model's first candidate passed the sandbox (results are
+    per candidate, in the model's order) to the category's history.
+    """
+    if not results or results[0].get("statusCode", 500) >= 500:
+        return
+    ranker.history.record(category, FIRST_BUCKET, int(streaming.passed(results[0])), 1)
+    with _stats_lock:
+        _stats["recorded"] += 1
+
+
+def get_stats() -> dict:
+    """
+    Candidates requested in total and first-candidate outcomes recorded, for
+    this warm container.
+    """
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,275 @@
+import os
+import re
+import ast
+
+# Files shorter than this are sent whole; slicing them saves too little
+SLICE_MIN_LINES = int(os.getenv("SLICE_MIN_LINES", "120"))
+# A slice keeping more than this share of the file isn't worth the splice risk
+SLICE_MAX_RATIO = float(os.getenv("SLICE_MAX_RATIO", "0.6"))
+
+_FRAME = re.compile(r'(File "([^"]*)", line )(\d+)')
+# Frames from the interpreter or installed packages aren't the user's code
+_LIBRARY_FRAME = re.compile(r"site-packages|dist-packages|[\\/]lib[\\/]python|<frozen")
+_MODULE_FRAME = re.compile(r'File "([^"]*)", line \d+, in <module>')
+
+_DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+_FUNCTIONS = (ast.FunctionDef, ast.AsyncFunctionDef)
+
+
+def submission_file(error_log: str):
+    """
+    The name the traceback gives the submitted file: that of its outermost
+    user-code `<module>` frame, else of its outermost user-code frame.
+    None without any. Frames in other files (the user's own modules) say
+    nothing about lines of the submission.
+    """
+    for match in _MODULE_FRAME.finditer(error_log or ""):
+        if not _LIBRARY_FRAME.search(match.group(1)):
+            return match.group(1)
+    for match in _FRAME.finditer(error_log or ""):
+        if not _LIBRARY_FRAME.search(match.group(2)):
+            return match.group(2)
+    return None
+
+
+def traceback_lines(error_log: str, line_count: int) -> list:
+    """
+    Line numbers of the traceback's frames in the submitted file (see
+    submission_file), outermost first.
+    """
+    own = submission_file(error_log)
+    lines = []
+    for match in _FRAME.finditer(error_log or ""):
+        number = int(match.group(3))
+        if match.group(2) == own and 1 <= number <= line_count:
+            lines.append(number)
+    return lines
+
+
+class _Chunk:
+    """
+    One or more top-level statements plus the comments and blank lines above them.
+    """
+
+    def __init__(self, first: int, last: int, stmts: list):
+        self.first = first
+        self.last = last
+        self.stmts = stmts
+
+    def key(self):
+        if len(self.stmts) != 1:
+            return None
+        stmt = self.stmts[0]
+        if isinstance(stmt, _DEFINITIONS):
+            return ("def", stmt.name)
+        if isinstance(stmt, (ast.Import, ast.ImportFrom)):
+            return ("import", ast.dump(stmt))
+        names = _assigned_names(stmt)
+        if names:
+            return ("assign", tuple(names))
+        return None
+
+
+def _chunks(tree: ast.Module, line_count: int):
+    chunks = []
+    for stmt in tree.body:
+        start = min([stmt.lineno] + [d.lineno for d in getattr(stmt, "decorator_list", [])])
+        if chunks and start <= chunks[-1].last:
+            # Shares a line with the previous statement (a; b)
+            chunks[-1].stmts.append(stmt)
+            chunks[-1].last = max(chunks[-1].last, stmt.end_lineno)
+        else:
+            first = chunks[-1].last + 1 if chunks else 1
+            chunks.append(_Chunk(first, stmt.end_lineno, [stmt]))
+    tail = (chunks[-1].last + 1 if chunks else 1, line_count)
+    return chunks, tail
+
+
+def _assigned_names(stmt) -> list:
+    if isinstance(stmt, ast.Assign):
+        targets = stmt.targets
+    elif isinstance(stmt, (ast.AnnAssign, ast.AugAssign)):
+        targets = [stmt.target]
+    else:
+        return []
+    return [n.id for t in targets for n in ast.walk(t) if isinstance(n, ast.Name)]
+
+
+def _defined_names(stmt) -> list:
+    if isinstance(stmt, _DEFINITIONS):
+        return [stmt.name]
+    if isinstance(stmt, (ast.Import, ast.ImportFrom)):
+        return [(alias.asname or alias.name).split(".")[0] for alias in stmt.names]
+    return _assigned_names(stmt)
+
+
+def _referenced_names(chunk: _Chunk) -> set:
+    return {n.id for stmt in chunk.stmts for n in ast.walk(stmt) if isinstance(n, ast.Name)}
+
+
+def _called_names(chunk: _Chunk) -> set:
+    names = set()
+    for stmt in chunk.stmts:
+        for node in ast.walk(stmt):
+            if isinstance(node, ast.Call):
+                if isinstance(node.func, ast.Name):
+                    names.add(node.func.id)
+                elif isinstance(node.func, ast.Attribute):
+                    names.add(node.func.attr)
+    return names
+
+
+def _innermost_function(chunk: _Chunk, line: int):
+    found = None
+    for stmt in chunk.stmts:
+        for node in ast.walk(stmt):
+            if isinstance(node, _FUNCTIONS) and node.lineno <= line <= node.end_lineno:
+                if found is None or node.lineno >= found.lineno:
+                    found = node
+    return found
+
+
+class CodeSlice:
+    """
+    The part of a file a traceback points at: every top-level definition on
+    the stack, the callers of the failing functions, every import, and
+    (transitively) every top-level name those use.
+    `code` and `error_log` (line numbers remapped) go to the models; splice()
+    puts a fixed slice back into the full file.
+    """
+
+    def __init__(self, lines: list, chunks: list, kept: set, tail: tuple, error_log: str):
+        self._lines = lines
+        self._chunks = chunks
+        self._kept = kept
+        self._tail = tail
+
+        parts, line_map, slice_line = [], {}, 1
+        for index in sorted(kept):
+            chunk = chunks[index]
+            for number in range(chunk.first, chunk.last + 1):
+                line_map[number] = slice_line
+                slice_line += 1
+            parts.append(self._text(chunk.first, chunk.last))
+        self.code = "\n".join(parts) + "\n"
+        own = submission_file(error_log)
+        self.error_log = _FRAME.sub(
+            lambda m: m.group(0) if m.group(2) != own or int(m.group(3)) not in line_map
+            else f"{m.group(1)}{line_map[int(m.group(3))]}",
+            error_log,
+        )
+        self.original_lines = len(lines)
+        self.sliced_lines = slice_line - 1
+
+    def _text(self, first: int, last: int) -> str:
+        return "\n".join(self._lines[first - 1:last])
+
+    def splice(self, fixed: str) -> str:
+        """
+        Full file with the fixed slice put back. Top-level statements are
+        matched by definition name, import or assignment target; new ones
+        land next to the definition that followed them in the fix.
+        Returns `fixed` unchanged if it doesn't parse.
+        """
+        try:
+            fixed_tree = ast.parse(fixed)
+        except (SyntaxError, ValueError):
+            return fixed
+        fixed_lines = fixed.splitlines()
+        fixed_chunks, _ = _chunks(fixed_tree, len(fixed_lines))
+
+        unmatched = {}
+        for index in sorted(self._kept):
+            key = self._chunks[index].key()
+            if key is not None:
+                unmatched.setdefault(key, []).append(index)
+
+        before = {i: [] for i in self._kept}
+        replacement = {}
+        pending = []
+        for chunk in fixed_chunks:
+            text = "\n".join(fixed_lines[chunk.first - 1:chunk.last])
+            candidates = unmatched.get(chunk.key())
+            if candidates:
+                index = candidates.pop(0)
+                before[index].extend(pending)
+                replacement[index] = text
+                pending = []
+            else:
+                pending.append(text)
+
+        out = []
+        last_kept = max(self._kept)
+        for index, chunk in enumerate(self._chunks):
+            if index not in self._kept:
+                out.append(self._text(chunk.first, chunk.last))
+                continue
+            out.extend(before[index])
+            # Kept statements the fix didn't return (unkeyed, or dropped) are
+            # represented by whatever the fix put around them
+            if index in replacement:
+                out.append(replacement[index])
+            if index == last_kept:
+                out.extend(pending)
+        if self._tail[0] <= self._tail[1]:
+            out.append(self._text(*self._tail))
+        return "\n".join(out) + "\n"
+
+
+def slice_code(code: str, error_log: str):
+    """
+    A CodeSlice around the traceback, or None when the whole file should be
+    sent: short or unparsable files, no user frames in the traceback, or a
+    slice that would keep most of the file anyway.
+    """
+    lines = code.splitlines()
+    if len(lines) < SLICE_MIN_LINES:
+        return None
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+    stack = traceback_lines(error_log, len(lines))
+    if not stack:
+        return None
+
+    chunks, tail = _chunks(tree, len(lines))
+    kept = set()
+    innermost = None
+    for line in stack:
+        for index, chunk in enumerate(chunks):
+            if chunk.first <= line <= chunk.last:
+                kept.add(index)
+                innermost = _innermost_function(chunk, line)
+    if not kept:
+        return None
+
+    defined_by = {}
+    for index, chunk in enumerate(chunks):
+        for stmt in chunk.stmts:
+            if isinstance(stmt, (ast.Import, ast.ImportFrom)):
+                kept.add(index)
+            for name in _defined_names(stmt):
+                defined_by.setdefault(name, []).append(index)
+
+    # Callers of the innermost user function (one level up, statically)
+    if innermost is not None:
+        for index, chunk in enumerate(chunks):
+            # Substring check first: walking every chunk's AST costs more than the parse
+            source = "\n".join(lines[chunk.first - 1:chunk.last])
+            if innermost.name in source and innermost.name in _called_names(chunk):
+                kept.add(index)
+
+    # Everything the kept code refers to, transitively
+    queue = list(kept)
+    while queue:
+        for name in _referenced_names(chunks[queue.pop()]):
+            for index in defined_by.get(name, []):
+                if index not in kept:
+                    kept.add(index)
+                    queue.append(index)
+
+    code_slice = CodeSlice(lines, chunks, kept, tail, error_log)
+    if code_slice.sliced_lines > SLICE_MAX_RATIO * len(lines):
+        return None
+    return code_slice
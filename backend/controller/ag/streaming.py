@@ -0,0 +1,291 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from . import providers, dedup
+
+# Sandbox results of reproduction scripts run against the original code,
+# keyed by content hash; warm invocations reuse them
+BASELINE_CACHE_SIZE = 256
+
+_baselines = OrderedDict()
+_baselines_lock = threading.Lock()
+
+DISCARDED_STDERR = "Discarded: the reproduction script passes on the original code."
+
+# Owner of runs asked for outside any stream (finish, check, reproduces)
+_PINNED = object()
+
+
+class IncrementalPacketParser:
+    """
+    Pulls FixPacket fields out of a JSON text stream as soon as each one is
+    complete. feed() returns a list of events:
+        ("reproduction_script", None, script)
+        ("candidate", index, code)
+    Anything outside the JSON (e.g. Markdown fences) is ignored.
+    """
+
+    def __init__(self):
+        self._stack = []          # open containers: "{" or "["
+        self._keys = []           # current key per open container (None for arrays)
+        self._expect_key = False
+        self._in_string = False
+        self._escaped = False
+        self._chars = []
+        self._candidate_count = 0
+
+    def feed(self, text: str) -> list:
+        events = []
+        for ch in text:
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                    self._chars.append(ch)
+                elif ch == "\\":
+                    self._escaped = True
+                    self._chars.append(ch)
+                elif ch == '"':
+                    self._in_string = False
+                    self._on_string(json.loads('"' + "".join(self._chars) + '"', strict=False), events)
+                else:
+                    self._chars.append(ch)
+            elif ch == '"':
+                self._in_string = True
+                self._chars = []
+            elif ch in "{[":
+                self._stack.append(ch)
+                self._keys.append(None)
+                self._expect_key = ch == "{"
+            elif ch in "}]":
+                if self._stack:
+                    self._stack.pop()
+                    self._keys.pop()
+                self._expect_key = False
+            elif ch == "," and self._stack and self._stack[-1] == "{":
+                self._expect_key = True
+        return events
+
+    def _on_string(self, value: str, events: list):
+        if self._expect_key and self._stack and self._stack[-1] == "{":
+            self._keys[-1] = value
+            self._expect_key = False
+            return
+
+        if self._stack == ["{"] and self._keys[0] == "reproduction_script":
+            events.append(("reproduction_script", None, value))
+        elif self._stack == ["{", "["] and self._keys[0] == "candidates":
+            events.append(("candidate", self._candidate_count, value))
+            self._candidate_count += 1
+
+
+class StreamingVerifier:
+    """
+    Sends candidates to the sandbox while the model is still writing the rest.
+    Runs are keyed by (reproduction_script, candidate fingerprint), so a packet
+    that loses a hedge or speculation race never has its results reported, and
+    equivalent candidates (see dedup.fingerprint) are never dispatched twice.
+    Such a packet's stream is closed, so its queued runs don't hold up the
+    winner's.
+    With original_code, each reproduction script is also run against it, ahead
+    of the candidates; a script that passes there reproduces nothing, so the
+    candidates still queued are dropped and report a discarded result.
+    verify(candidate_code, test_code) -> result dict, e.g. lambda_verifier().
+    """
+
+    def __init__(self, verify, max_workers: int = 3, original_code: str = None):
+        self._verify = verify
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pve-verify")
+        self._lock = threading.Lock()
+        self._runs = {}
+        self._baseline_runs = {}
+        # Run -> the streams that asked for it (_PINNED: finish/check/reproduces)
+        self._owners = {}
+        self._closed = False
+        self.original_code = original_code
+
+    def stream(self):
+        """
+        Event callback for one generation (pass it to brain.stream_fix_packet).
+        close() it when that generation is dropped (it lost a hedge, or its
+        speculation was cancelled): the provider call keeps running in its
+        thread, but its candidates stop taking sandbox slots.
+        """
+        return _Stream(self)
+
+    def finish(self, packet: dict) -> list:
+        """
+        Results for the final packet, one per candidate; runs anything that
+        wasn't streamed (e.g. a DeepSeek packet) and waits for the rest.
+        """
+        script = packet["reproduction_script"]
+        with self._lock:
+            futures = [self._submit(script, candidate) for candidate in packet["candidates"]]
+            self._closed = True
+        results = self._results(script, futures)
+        self._executor.shutdown(wait=False)
+        return results
+
+    def check(self, script: str, candidates: list) -> list:
+        """
+        Verifies candidates now and waits for their results, without closing
+        the verifier; a later finish() reuses the runs.
+        """
+        with self._lock:
+            futures = [self._submit(script, candidate) for candidate in candidates]
+        return self._results(script, futures)
+
+    def reproduces(self, script: str):
+        """
+        Whether the original code fails the script (waits for that run), or
+        None without an original or when the sandbox couldn't tell.
+        """
+        with self._lock:
+            baseline = self._baseline(script)
+        if baseline is None:
+            return None
+        result = baseline.result()
+        if result.get("statusCode") != 200:
+            return None
+        return not passed(result)
+
+    def dispatched(self) -> int:
+        return len(self._runs)
+
+    def _submit(self, script: str, candidate: str, owner=None):
+        # Caller holds the lock
+        key = (script, dedup.fingerprint(candidate))
+        future = self._runs.get(key)
+        if future is None:
+            baseline = self._baseline(script, owner)
+            future = self._executor.submit(self._safe_verify, candidate, script)
+            if baseline is not None:
+                # Not started yet when the original turns out to pass: never runs
+                baseline.add_done_callback(lambda b: not b.cancelled() and passed(b.result()) and future.cancel())
+            self._runs[key] = future
+        else:
+            self._baseline(script, owner)
+        self._owners.setdefault(("run", key), set()).add(owner or _PINNED)
+        return future
+
+    def _release(self, owner):
+        # A closed stream's runs that nobody else wants and that haven't
+        # started are cancelled (caller holds the lock)
+        for slot, owners in list(self._owners.items()):
+            if owner not in owners:
+                continue
+            owners.discard(owner)
+            if owners:
+                continue
+            del self._owners[slot]
+            kind, key = slot
+            runs = self._runs if kind == "run" else self._baseline_runs
+            if runs[key].cancel():
+                del runs[key]
+
+    def _baseline(self, script: str, owner=None):
+        # The original's run for this script (caller holds the lock)
+        if self.original_code is None:
+            return None
+        self._owners.setdefault(("baseline", script), set()).add(owner or _PINNED)
+        future = self._baseline_runs.get(script)
+        if future is None:
+            key = hashlib.sha256(f"{self.original_code}\0{script}".encode("utf-8")).hexdigest()
+            with _baselines_lock:
+                cached = _baselines.get(key)
+            if cached is not None:
+                future = Future()
+                future.set_result(cached)
+            else:
+                future = self._executor.submit(self._safe_verify, self.original_code, script)
+                future.add_done_callback(lambda f: f.cancelled() or _remember_baseline(key, f.result()))
+            self._baseline_runs[script] = future
+        return future
+
+    def _results(self, script: str, futures: list) -> list:
+        if self.reproduces(script) is False:
+            print("Reproduction script passes on the original code. Discarding the packet.")
+            return [discarded_result() for _ in futures]
+        return [f.result() for f in futures]
+
+    def _safe_verify(self, candidate: str, script: str) -> dict:
+        try:
+            return self._verify(candidate, script)
+        except Exception as e:
+            print(f"Streaming verification failed: {e}")
+            return {"statusCode": 500, "error": str(e)}
+
+
+class _Stream:
+    """
+    One generation's event callback; see StreamingVerifier.stream().
+    """
+
+    def __init__(self, verifier: StreamingVerifier):
+        self._verifier = verifier
+        self._script = None
+        self._waiting = []
+        self.closed = False
+
+    def __call__(self, kind, index, value):
+        verifier = self._verifier
+        with verifier._lock:
+            if verifier._closed or self.closed:
+                # A generation that was dropped is still running; ignore it
+                return
+            if kind == "reproduction_script":
+                self._script = value
+                waiting, self._waiting = self._waiting, []
+                for candidate in waiting:
+                    verifier._submit(value, candidate, self)
+            elif self._script is None:
+                self._waiting.append(value)
+            else:
+                verifier._submit(self._script, value, self)
+
+    def close(self):
+        with self._verifier._lock:
+            if not self.closed:
+                self.closed = True
+                self._verifier._release(self)
+
+
+def passed(result: dict) -> bool:
+    """
+    A sandbox result where the reproduction script ran clean.
+    """
+    return result.get("statusCode") == 200 and result.get("return_code") == 0
+
+
+def discarded_result() -> dict:
+    return {"statusCode": 200, "return_code": -9, "stdout": "", "stderr": DISCARDED_STDERR}
+
+
+def _remember_baseline(key: str, result: dict):
+    if result.get("statusCode") != 200:
+        return
+    with _baselines_lock:
+        _baselines[key] = result
+        _baselines.move_to_end(key)
+        while len(_baselines) > BASELINE_CACHE_SIZE:
+            _baselines.popitem(last=False)
+
+
+def lambda_verifier(function_name: str):
+    """
+    verify() callable that invokes the sandbox Lambda synchronously.
+    Returns the sandbox's decoded body plus its statusCode.
+    """
+    def verify(candidate_code: str, test_code: str) -> dict:
+        response = providers.lambda_client().invoke(
+            FunctionName=function_name,
+            InvocationType="RequestResponse",
+            Payload=json.dumps({"candidate_code": candidate_code, "test_code": test_code}),
+        )
+        payload = json.loads(response["Payload"].read())
+        result = json.loads(payload.get("body") or "{}")
+        result["statusCode"] = payload.get("statusCode")
+        return result
+
+    return verify
@@ -0,0 +1,343 @@
+import os
+import re
+import ast
+import sys
+import difflib
+import builtins
+import threading
+from . import categorizer, slicer
+
+# Most template candidates in one packet
+MAX_CANDIDATES = int(os.getenv("TEMPLATE_MAX_CANDIDATES", "4"))
+
+# Runs the submission exactly like `python fix.py`. Templates only apply when
+# the traceback shows the crash happening that way (a "<module>" frame, or
+# no frames at all), so this script is the reproduction.
+REPRODUCTION_SCRIPT = 'import runpy\n\nrunpy.run_path("fix.py", run_name="__main__")\n'
+
+_OPERATORS = {
+    "+": ast.Add, "-": ast.Sub, "*": ast.Mult, "/": ast.Div,
+    "//": ast.FloorDiv, "%": ast.Mod, "**": ast.Pow,
+}
+_NUMERIC_TYPES = {"int", "float"}
+
+_UNSUPPORTED_OPERAND = re.compile(r"unsupported operand type\(s\) for ([^:]+): '(\w+)' and '(\w+)'")
+_CONCATENATE = re.compile(r'can only concatenate (str|list) \(not "(\w+)"\) to \1')
+_UNDEFINED_NAME = re.compile(r"name '(\w+)' is not defined")
+
+# Functions whose calls are cheap and side-effect free enough to evaluate twice
+_PURE_CALLS = {"len", "abs", "sum", "min", "max", "round", "int", "float", "str"}
+
+_stats = {"generated": 0, "no_template": 0}
+_lock = threading.Lock()
+
+
+class _Rewrite:
+    """
+    A source-level edit: the text between two (line, byte column) positions
+    is replaced, so the rest of the file keeps its formatting and comments.
+    """
+
+    def __init__(self, start, end, text: str):
+        self.start = start
+        self.end = end
+        self.text = text
+
+    @classmethod
+    def of(cls, node, text: str):
+        return cls((node.lineno, node.col_offset), (node.end_lineno, node.end_col_offset), text)
+
+
+def generate(code: str, error_log: str):
+    """
+    A FixPacket of rule-based rewrites for textbook runtime errors:
+    ZeroDivisionError (guarded division), KeyError (dict.get), IndexError
+    (bounds-checked access, pop from empty list), TypeError on mixed
+    int/str operands (conversions) and NameError (closest defined name, or
+    a missing stdlib import). Each candidate changes one site.
+    Returns None when no template fits; the candidates still need verifying.
+    """
+    packet = _generate(code, error_log)
+    with _lock:
+        _stats["generated" if packet else "no_template"] += 1
+    return packet
+
+
+def get_stats() -> dict:
+    with _lock:
+        return dict(_stats)
+
+
+def _generate(code: str, error_log: str):
+    exception = categorizer.last_exception_name(error_log)
+    template = _TEMPLATES.get(exception)
+    if template is None or not _runs_as_script(error_log):
+        return None
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+
+    frames = slicer.traceback_lines(error_log, len(code.splitlines()))
+    line = frames[-1] if frames else None
+    message = _exception_message(error_log)
+
+    candidates = []
+    for rewrites in template(tree, code, line, message):
+        candidate = _apply(code, rewrites)
+        if candidate != code and candidate not in candidates and _parses(candidate):
+            candidates.append(candidate)
+        if len(candidates) >= MAX_CANDIDATES:
+            break
+    if not candidates:
+        return None
+    return {"reproduction_script": REPRODUCTION_SCRIPT, "candidates": candidates}
+
+
+def _runs_as_script(error_log: str) -> bool:
+    return "<module>" in error_log or 'File "' not in error_log
+
+
+def _exception_message(error_log: str) -> str:
+    for line in reversed(error_log.strip().splitlines()):
+        if categorizer.EXCEPTION_LINE.match(line):
+            return line.split(":", 1)[1].strip() if ":" in line else ""
+    return ""
+
+
+def _sites(tree: ast.Module, line, match):
+    # Nodes `match` accepts, the ones on the traceback's line first. With a
+    # line to go on, only that line's nodes are candidates.
+    nodes = [node for node in ast.walk(tree) if match(node)]
+    nodes.sort(key=lambda node: (node.lineno, node.col_offset))
+    if line is not None:
+        return [node for node in nodes if node.lineno <= line <= node.end_lineno]
+    return nodes
+
+
+def _is_pure(node) -> bool:
+    # Safe to evaluate twice (once in the guard, once for the value)
+    if isinstance(node, (ast.Name, ast.Constant)):
+        return True
+    if isinstance(node, ast.Attribute):
+        return _is_pure(node.value)
+    if isinstance(node, ast.Subscript):
+        return _is_pure(node.value) and _is_pure(node.slice)
+    if isinstance(node, ast.UnaryOp):
+        return _is_pure(node.operand)
+    if isinstance(node, ast.BinOp):
+        return _is_pure(node.left) and _is_pure(node.right)
+    if isinstance(node, ast.Call):
+        return (isinstance(node.func, ast.Name) and node.func.id in _PURE_CALLS and not node.keywords
+                and all(_is_pure(arg) for arg in node.args))
+    return False
+
+
+def _source(code: str, node) -> str:
+    text = ast.get_source_segment(code, node)
+    # Operands of a new expression: parenthesize anything compound
+    return text if isinstance(node, (ast.Name, ast.Constant, ast.Attribute, ast.Subscript, ast.Call)) else f"({text})"
+
+
+def _zero_division(tree, code, line, message):
+    def match(node):
+        return (isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Div, ast.FloorDiv, ast.Mod))
+                and _is_pure(node.right))
+
+    for node in _sites(tree, line, match):
+        expression = ast.get_source_segment(code, node)
+        divisor = _source(code, node.right)
+        for default in ("0", "None"):
+            yield [_Rewrite.of(node, f"({expression} if {divisor} else {default})")]
+
+
+def _key_error(tree, code, line, message):
+    key = message.strip()
+
+    def match(node):
+        return (isinstance(node, ast.Subscript) and _is_pure(node.value)
+                and not isinstance(node.slice, ast.Slice))
+
+    for node in _sites(tree, line, match):
+        if key and isinstance(node.slice, ast.Constant) and repr(node.slice.value) != key:
+            # KeyError: 'a' names the key; other literal keys can't be it
+            continue
+        container, index = _source(code, node.value), ast.get_source_segment(code, node.slice)
+        if isinstance(node.ctx, ast.Load):
+            yield [_Rewrite.of(node, f"{container}.get({index})")]
+            yield [_Rewrite.of(node, f"{container}.get({index}, 0)")]
+        elif isinstance(node.ctx, ast.Store):
+            # counts[word] += 1 on a missing key
+            statement = _augmented_assignment(tree, node)
+            operator = statement is not None and _operator_symbol(statement.op)
+            if operator:
+                # counts[w] *= 2 + 1 multiplies by 3, not by 2 then adds 1
+                value = _source(code, statement.value)
+                text = f"{container}[{index}] = {container}.get({index}, 0) {operator} {value}"
+                yield [_Rewrite.of(statement, text)]
+
+
+def _index_error(tree, code, line, message):
+    if message.startswith("pop from empty"):
+        def match_pop(node):
+            return (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                    and node.func.attr == "pop" and not node.args and _is_pure(node.func.value))
+
+        for node in _sites(tree, line, match_pop):
+            container = _source(code, node.func.value)
+            yield [_Rewrite.of(node, f"({container}.pop() if {container} else None)")]
+        return
+
+    def match(node):
+        return (isinstance(node, ast.Subscript) and isinstance(node.ctx, ast.Load) and _is_pure(node.value)
+                and _is_pure(node.slice) and not isinstance(node.slice, ast.Slice))
+
+    for node in _sites(tree, line, match):
+        expression = ast.get_source_segment(code, node)
+        container, index = _source(code, node.value), ast.get_source_segment(code, node.slice)
+        if isinstance(node.slice, ast.Constant) and node.slice.value in (0, -1):
+            guard = container
+        elif isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, int) and node.slice.value > 0:
+            guard = f"len({container}) > {index}"
+        else:
+            guard = f"-len({container}) <= {index} < len({container})"
+        for default in ("None", "0"):
+            yield [_Rewrite.of(node, f"({expression} if {guard} else {default})")]
+
+
+def _type_error(tree, code, line, message):
+    unsupported = _UNSUPPORTED_OPERAND.search(message)
+    concatenate = _CONCATENATE.search(message)
+    if unsupported:
+        symbol, left_type, right_type = unsupported.groups()
+        op = _OPERATORS.get(symbol.strip())
+        conversions = []
+        if left_type in _NUMERIC_TYPES and right_type == "str":
+            conversions = [(None, left_type), ("str", None)]
+        elif left_type == "str" and right_type in _NUMERIC_TYPES:
+            conversions = [(right_type, None), (None, "str")]
+    elif concatenate:
+        container, other = concatenate.groups()
+        op = ast.Add
+        if container == "str":
+            conversions = [(None, "str")] + ([(other, None)] if other in _NUMERIC_TYPES else [])
+        else:
+            conversions = [(None, "[]")]
+    else:
+        return
+
+    if op is None:
+        return
+
+    def match(node):
+        return isinstance(node, ast.BinOp) and isinstance(node.op, op)
+
+    for node in _sites(tree, line, match):
+        operator = _operator_symbol(node.op)
+        for left_call, right_call in conversions:
+            left = _convert(code, node.left, left_call)
+            right = _convert(code, node.right, right_call)
+            yield [_Rewrite.of(node, f"{left} {operator} {right}")]
+
+
+def _convert(code: str, node, call):
+    text = ast.get_source_segment(code, node)
+    if call is None:
+        return _source(code, node)
+    if call == "[]":
+        return f"[{text}]"
+    return f"{call}({text})"
+
+
+def _name_error(tree, code, line, message):
+    match = _UNDEFINED_NAME.search(message)
+    if not match:
+        return
+    missing = match.group(1)
+    uses = [node for node in ast.walk(tree)
+            if isinstance(node, ast.Name) and node.id == missing and isinstance(node.ctx, ast.Load)]
+
+    # A typo: every use renamed to a close defined name
+    defined = _bound_names(tree) | set(dir(builtins))
+    for name in difflib.get_close_matches(missing, sorted(defined - {missing}), n=3, cutoff=0.75):
+        yield [_Rewrite.of(node, name) for node in uses]
+
+    # A module that was never imported
+    if missing in getattr(sys, "stdlib_module_names", ()):
+        line_number = _import_line(tree)
+        yield [_Rewrite((line_number, 0), (line_number, 0), f"import {missing}\n")]
+
+
+def _bound_names(tree: ast.Module) -> set:
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            names.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update((alias.asname or alias.name).split(".")[0] for alias in node.names)
+    return names
+
+
+def _import_line(tree: ast.Module) -> int:
+    # After a module docstring and __future__ imports, which must come first
+    line = 1
+    for index, stmt in enumerate(tree.body):
+        docstring = (index == 0 and isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Constant)
+                     and isinstance(stmt.value.value, str))
+        if docstring or (isinstance(stmt, ast.ImportFrom) and stmt.module == "__future__"):
+            line = stmt.end_lineno + 1
+        else:
+            break
+    return line
+
+
+def _augmented_assignment(tree: ast.Module, target):
+    for node in ast.walk(tree):
+        if isinstance(node, ast.AugAssign) and node.target is target:
+            return node
+    return None
+
+
+def _operator_symbol(op):
+    for symbol, op_type in _OPERATORS.items():
+        if isinstance(op, op_type):
+            return symbol
+    return None
+
+
+def _apply(code: str, rewrites: list) -> str:
+    # Positions are (1-based line, UTF-8 byte column), as in the AST
+    lines = code.encode("utf-8").splitlines(keepends=True)
+    offsets = [0]
+    for text in lines:
+        offsets.append(offsets[-1] + len(text))
+    source = code.encode("utf-8")
+
+    def offset(position):
+        line, column = position
+        return offsets[min(line, len(lines) + 1) - 1] + column
+
+    for rewrite in sorted(rewrites, key=lambda r: r.start, reverse=True):
+        source = source[:offset(rewrite.start)] + rewrite.text.encode("utf-8") + source[offset(rewrite.end):]
+    return source.decode("utf-8")
+
+
+def _parses(code: str) -> bool:
+    try:
+        ast.parse(code)
+        return True
+    except (SyntaxError, ValueError):
+        return False
+
+
+_TEMPLATES = {
+    "ZeroDivisionError": _zero_division,
+    "KeyError": _key_error,
+    "IndexError": _index_error,
+    "TypeError": _type_error,
+    "NameError": _name_error,
+}
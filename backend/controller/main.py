@@ -1,5 +1,13 @@
+import os
 import json
-from ag import categorizer, brain, fallback
+import asyncio
+from ag import categorizer, pipeline, streaming, dedup, jsonrepair, breaker, templates, ranker, sizing
+
+# When set, candidates are verified by the controller itself as Gemini streams them
+SANDBOX_FUNCTION_NAME = os.getenv("SANDBOX_FUNCTION_NAME")
+# Most sandbox runs the Step Functions fan-out starts at once; below that it
+# runs as many as there are distinct candidates
+FANOUT_MAX_CONCURRENCY = int(os.getenv("FANOUT_MAX_CONCURRENCY", "5"))
 
 def lambda_handler(event, context):
     """
@@ -23,36 +31,61 @@ def lambda_handler(event, context):
                 "body": json.dumps({"error": "Missing 'code' or 'error' field"})
             }
 
-        # Step 1: Categorize
+        # Step 1 + 2: Categorize and Generate Fix (Brain -> Fallback), overlapped
         print("Categorizing error...")
-        error_type = categorizer.classify_error(code, error_log)
-        print(f"Error classified as: {error_type}")
+        verifier = None
+        if SANDBOX_FUNCTION_NAME:
+            verifier = streaming.StreamingVerifier(streaming.lambda_verifier(SANDBOX_FUNCTION_NAME),
+                                                   original_code=code)
 
-        # Step 2: Generate Fix (Brain -> Fallback)
         try:
-            print("Attempting generation with Gemini...")
-            result = brain.generate_fix_packet(code, error_log, error_type)
-            source = "Gemini 1.5 Flash"
-        except Exception as e:
-            print(f"Gemini failed: {e}. Switching to DeepSeek...")
-            try:
-                result = fallback.generate_fix_packet(code, error_log, error_type)
-                source = "DeepSeek V3"
-            except Exception as e2:
-                print(f"DeepSeek failed: {e2}")
-                return {
-                    "statusCode": 500,
-                    "body": json.dumps({"error": "All AI models failed to generate a fix."})
-                }
+            outcome = asyncio.run(pipeline.run(code, error_log, verifier))
+        except pipeline.GenerationError:
+            return {
+                "statusCode": 500,
+                "body": json.dumps({"error": "All AI models failed to generate a fix."})
+            }
+
+        error_type = outcome["error_type"]
+        print(f"Error classified as: {error_type}")
+        print(f"Categorizer stats: {categorizer.get_stats()}")
+        print(f"Fix cache stats: {pipeline.fix_cache.stats()}")
+        print(f"JSON repair stats: {jsonrepair.get_stats()}")
+        print(f"Circuit breakers: {breaker.get_stats()}")
+        print(f"Coalesced requests: {pipeline.inflight.stats()}")
+        print(f"Template fixes: {templates.get_stats()}")
+        print(f"Candidate counts: {sizing.get_stats()}")
+
+        # Equivalent candidates are verified once; index_map[i] is the position
+        # of candidate i in fanout.candidates (see dedup.expand)
+        distinct, index_map = dedup.dedupe(outcome["result"]["candidates"])
+        print(f"Distinct candidates: {len(distinct)} of {len(index_map)}")
+
+        # Most likely to pass first: the sandbox starts them in this order
+        order = ranker.rank(distinct, code, error_log, error_type)
+        position = {old: new for new, old in enumerate(order)}
+        distinct = [distinct[i] for i in order]
+        index_map = [position[i] for i in index_map]
+        print(f"Candidate ranking: {order}, stats: {ranker.get_stats()}")
 
         # Step 3: Return Response
         response_payload = {
             "status": "success",
-            "source": source,
+            "source": outcome["source"],
             "error_type": error_type,
             "connection_id": connection_id,  # Preserve for downstream
-            "data": result
+            "timings": outcome["timings"],
+            "data": outcome["result"],
+            "fanout": {
+                "candidates": distinct,
+                "index_map": index_map,
+                "max_concurrency": min(len(distinct), FANOUT_MAX_CONCURRENCY)
+            }
         }
+        if "verification_results" in outcome:
+            response_payload["verification_results"] = outcome["verification_results"]
+        if "reproduced" in outcome:
+            response_payload["reproduced"] = outcome["reproduced"]
 
         return {
             "statusCode": 200,
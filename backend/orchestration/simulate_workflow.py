@@ -21,6 +21,9 @@ from dotenv import load_dotenv
 # Load env for controller
 load_dotenv(os.path.join(os.path.dirname(__file__), '../controller/.env'))
 
+# Race candidates (first pass wins, losers killed) instead of running each to completion
+RACE_MODE = True
+
 def simulate_full_flow():
     print("\n=== TRUTH ENGINE: ORCHESTRATION SIMULATION ===\n")
 
@@ -58,17 +61,34 @@ print(calculate_average([]))
     data = brain_output['data']
     reproduction_script = data['reproduction_script']
     candidates = data['candidates']
+    # Equivalent candidates collapsed by the controller
+    distinct = brain_output['fanout']['candidates']
+    index_map = brain_output['fanout']['index_map']
     
-    print(f"\nGenerated {len(candidates)} Candidates.")
+    print(f"\nGenerated {len(candidates)} Candidates ({len(distinct)} distinct, "
+          f"fan-out concurrency {brain_output['fanout']['max_concurrency']}).")
     # print(f"Reproduction Script Preview:\n{reproduction_script[:100]}...")
 
     # 2. FAN-OUT: Run Sandbox for each candidate
     print("\n--- [Step 2] Fan-Out Execution (The Body) ---")
+
+    if RACE_MODE:
+        race_candidates(distinct, index_map, reproduction_script, broken_code)
+        return
+
+    # Same as CheckReproduction: skip the fan-out when the script passes on the original
+    baseline_response = sandbox_app.lambda_handler({
+        "candidate_code": broken_code,
+        "test_code": reproduction_script
+    }, None)
+    if baseline_response['statusCode'] == 200 and json.loads(baseline_response['body'])['return_code'] == 0:
+        print("Reproduction script passes on the original code. Packet discarded.")
+        return
+
+    distinct_results = []
     
-    results = []
-    
-    for i, candidate in enumerate(candidates):
-        print(f"\n> Running Candidate {i+1}...")
+    for i, candidate in enumerate(distinct):
+        print(f"\n> Running Distinct Candidate {i+1}...")
         
         sandbox_event = {
             "candidate_code": candidate,
@@ -88,14 +108,17 @@ print(calculate_average([]))
             if status == "FAIL":
                 print(f"  Stderr: {result_body['stderr'].strip()[:200]}")
             
-            results.append({
-                "candidate_id": i+1,
+            distinct_results.append({
                 "status": status,
                 "duration": t_end - t_start,
                 "details": result_body
             })
         else:
             print(f"  Result: [SYSTEM ERROR] {sandbox_response['statusCode']}")
+            distinct_results.append({"status": "ERROR", "duration": t_end - t_start})
+
+    # Every original candidate gets the result of its distinct representative
+    results = [dict(distinct_results[j], candidate_id=i+1) for i, j in enumerate(index_map)]
 
     # 3. AGGREGATION
     print("\n--- [Step 3] Final Results ---")
@@ -107,5 +130,52 @@ print(calculate_average([]))
     else:
         print("NO FIX FOUND. All candidates failed.")
 
+def race_candidates(candidates, index_map, reproduction_script, original_code=None):
+    """
+    Starts every distinct candidate at once in one sandbox; the first to pass
+    wins and the rest are killed. Results come back per original candidate.
+    The original code runs alongside them; if it passes too, nothing wins.
+    """
+    print(f"\n> Racing {len(candidates)} Candidates...")
+
+    sandbox_event = {
+        "candidates": candidates,
+        "index_map": index_map,
+        "test_code": reproduction_script,
+        "original_code": original_code,
+        "race": True
+    }
+
+    t_start = time.time()
+    sandbox_response = sandbox_app.lambda_handler(sandbox_event, None)
+    t_end = time.time()
+
+    if sandbox_response['statusCode'] != 200:
+        print(f"  Result: [SYSTEM ERROR] {sandbox_response['statusCode']}")
+        return
+
+    race_body = json.loads(sandbox_response['body'])
+    if race_body.get('reproduced') is False:
+        print("Reproduction script passes on the original code. Packet discarded.")
+        return
+    for i, result_body in enumerate(race_body['results']):
+        if 'error' in result_body:
+            print(f"  Candidate {i+1}: [BLOCKED] {result_body['error']}")
+            continue
+        return_code = result_body['return_code']
+        status = "PASS" if i == race_body['winner'] else "FAIL"
+        if return_code == -9:
+            status = "CANCELLED"
+        print(f"  Candidate {i+1}: [{status}] (Exit Code: {return_code})")
+        if status == "FAIL":
+            print(f"  Stderr: {result_body['stderr'].strip()[:200]}")
+
+    # 3. AGGREGATION
+    print("\n--- [Step 3] Final Results ---")
+    if race_body['winner'] is not None:
+        print(f"WINNER: Candidate {race_body['winner'] + 1} ({t_end - t_start:.2f}s)")
+    else:
+        print("NO FIX FOUND. All candidates failed.")
+
 if __name__ == "__main__":
     simulate_full_flow()
@@ -1,10 +1,26 @@
+import os
 import json
-from sandbox import security, runner
+from sandbox import runner, forkserver, cache, stages
+
+# Per-candidate execution limit (seconds); part of the result cache key
+EXECUTION_TIMEOUT = 5
+
+# Import the heavy libraries during Lambda init so forked runs inherit them
+if os.getenv("SANDBOX_EXEC_MODE") == "fork" and forkserver.is_supported():
+    forkserver.warm_up()
 
 def lambda_handler(event, context):
     """
     AWS Lambda Handler for Sandbox Execution.
     Expected Payload: { "candidate_code": "...", "test_code": "..." }
+    Batch Payload:    { "candidates": ["...", ...], "test_code": "..." }
+                      Optional "race": true (first pass wins, others killed)
+                      and "expected_output": "..." (must appear in stdout).
+                      Optional "index_map": [...] from the controller's
+                      deduplication; results come back per original candidate.
+                      Optional "original_code": the user's code, run with the
+                      candidates; when the script passes on it, the batch is
+                      discarded early ("reproduced": false).
     """
     print("Received sandbox request")
     
@@ -18,6 +34,13 @@ def lambda_handler(event, context):
     else:
         body = event
 
+    if "candidates" in body:
+        return _batch_handler(body.get("candidates"), body.get("test_code"),
+                              race=bool(body.get("race")),
+                              expected_output=body.get("expected_output"),
+                              index_map=body.get("index_map"),
+                              original_code=body.get("original_code"))
+
     candidate = body.get("candidate_code")
     test_script = body.get("test_code")
 
@@ -27,18 +50,27 @@ def lambda_handler(event, context):
             "body": json.dumps({"error": "Missing 'candidate_code' or 'test_code'"})
         }
 
-    # 1. Security Check
-    if not security.validate_code_safety(candidate):
+    # 1. Pre-run stages: compile -> lint -> security
+    report = stages.new_report()
+    rejection = stages.screen(candidate, report)
+    print(f"Stages: {report}, totals: {stages.get_stats()}")
+    if rejection is not None and rejection.stage == "security":
         return {
             "statusCode": 403,
-            "body": json.dumps({
-                "error": "Security Violation",
-                "details": "Code contains banned keywords (os, subprocess, eval, etc.)"
-            })
+            "body": json.dumps(_security_error(rejection.detail))
         }
 
-    # 2. Execution
-    result = runner.execute_verification(candidate, test_script)
+    # 2. Execution (skipped when this exact pair was already verified)
+    if rejection is not None:
+        result = rejection.detail
+    else:
+        key = cache.default_cache.key(candidate, test_script, EXECUTION_TIMEOUT)
+        result = cache.default_cache.get(key)
+        if result is None:
+            result = runner.execute_verification(candidate, test_script, timeout=EXECUTION_TIMEOUT)
+            cache.default_cache.put(key, result)
+        else:
+            print("Result cache hit")
 
     # 3. Response
     return {
@@ -46,3 +78,143 @@ def lambda_handler(event, context):
         "headers": {"Content-Type": "application/json"},
         "body": json.dumps(result)
     }
+
+
+def _batch_handler(candidates, test_script, race=False, expected_output=None, index_map=None,
+                   original_code=None):
+    """
+    Verifies a whole candidate set in parallel inside this one sandbox.
+    Candidates are screened first (see stages.screen): ones that don't compile
+    or use undefined names get a failed-run result without being run, and
+    blocked ones get the same error body as a single 403 request.
+    In race mode the response also carries the winning candidate index.
+    With an index_map, `candidates` are the distinct ones and results (and
+    the winner) are reported against the original candidate positions.
+    With original_code, the script also runs against it (baseline results
+    are cached by content like any other run); a script that passes on the
+    original reproduces nothing, and every candidate gets a discarded result.
+    """
+    if not candidates or not test_script:
+        return {
+            "statusCode": 400,
+            "body": json.dumps({"error": "Missing 'candidates' or 'test_code'"})
+        }
+
+    results = [None] * len(candidates)
+    safe = []
+    report = stages.new_report()
+    for i, candidate in enumerate(candidates):
+        rejection = stages.screen(candidate, report)
+        if rejection is None:
+            safe.append(i)
+        elif rejection.stage == "security":
+            results[i] = _security_error(rejection.detail)
+        else:
+            results[i] = rejection.detail
+    print(f"Stage stats: {stages.get_stats()}")
+
+    # Serve what we can from the result cache; only misses reach the runner
+    keys = {}
+    to_run = []
+    for i in safe:
+        keys[i] = cache.default_cache.key(candidates[i], test_script, EXECUTION_TIMEOUT)
+        results[i] = cache.default_cache.get(keys[i])
+        if results[i] is None:
+            to_run.append(i)
+
+    response_body = {}
+    executed = []
+    cached_winner = None
+    if race:
+        cached_winner = next((i for i in safe if i not in to_run
+                              and runner.is_pass(results[i], expected_output)), None)
+    baseline, baseline_key = _baseline(original_code, test_script)
+    if baseline is not None and runner.is_pass(baseline, expected_output):
+        # Known from the cache: this script reproduces nothing, run nothing
+        to_run = []
+    elif baseline_key is not None and baseline is None and cached_winner is not None:
+        # A cached pass already won; it stands once the original fails
+        baseline = runner.execute_verification(original_code, test_script, timeout=EXECUTION_TIMEOUT)
+        cache.default_cache.put(baseline_key, baseline)
+        for i in to_run:
+            results[i] = runner.cancelled_result()
+        response_body["winner"] = cached_winner
+        to_run = []
+    elif baseline_key is not None and baseline is None:
+        checked = runner.execute_with_baseline(original_code, [candidates[i] for i in to_run], test_script,
+                                               timeout=EXECUTION_TIMEOUT, race=race,
+                                               expected_output=expected_output)
+        baseline = checked["baseline"]
+        cache.default_cache.put(baseline_key, baseline)
+        executed = checked["results"]
+        if race:
+            response_body["winner"] = to_run[checked["winner"]] if checked["winner"] is not None else None
+    elif race:
+        if cached_winner is not None:
+            for i in to_run:
+                results[i] = runner.cancelled_result()
+            response_body["winner"] = cached_winner
+            to_run = []
+        else:
+            raced = runner.execute_race([candidates[i] for i in to_run], test_script,
+                                        timeout=EXECUTION_TIMEOUT, expected_output=expected_output)
+            executed = raced["results"]
+            response_body["winner"] = to_run[raced["winner"]] if raced["winner"] is not None else None
+    else:
+        executed = runner.execute_batch([candidates[i] for i in to_run], test_script,
+                                        timeout=EXECUTION_TIMEOUT)
+
+    for i, result in zip(to_run, executed):
+        results[i] = result
+        cache.default_cache.put(keys[i], result)
+
+    reproduced = baseline is None or not runner.is_pass(baseline, expected_output)
+    if not reproduced:
+        print("Reproduction script passes on the original code. Discarding the packet.")
+        results = [runner.discarded_result() for _ in results]
+        if race:
+            response_body["winner"] = None
+    response_body["results"] = results
+    response_body["stages"] = report
+    if baseline_key is not None:
+        response_body["baseline"] = baseline
+        response_body["reproduced"] = reproduced
+
+    if index_map:
+        response_body["results"] = [results[i] for i in index_map]
+        if response_body.get("winner") is not None:
+            response_body["winner"] = index_map.index(response_body["winner"])
+
+    return {
+        "statusCode": 200,
+        "headers": {"Content-Type": "application/json"},
+        "body": json.dumps(response_body)
+    }
+
+
+def _baseline(original_code, test_script):
+    """
+    (cached baseline result or None, its cache key), or (None, None) when
+    there is no original to check. An original that doesn't compile fails
+    without being run; one the security stage blocks is never run, so
+    nothing is known about it.
+    """
+    if not original_code:
+        return None, None
+    rejection = stages.screen(original_code)
+    if rejection is not None and rejection.stage == "security":
+        return None, None
+    key = cache.default_cache.key(original_code, test_script, EXECUTION_TIMEOUT)
+    if rejection is not None:
+        return rejection.detail, key
+    return cache.default_cache.get(key), key
+
+
+def _security_error(violations):
+    for v in violations:
+        print(f"Security Violation Detected: {v.message} (line {v.line}, col {v.col})")
+    return {
+        "error": "Security Violation",
+        "details": "Code contains banned keywords (os, subprocess, eval, etc.)",
+        "violations": [v._asdict() for v in violations]
+    }
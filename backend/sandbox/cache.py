@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import hashlib
+import tempfile
+from collections import OrderedDict
+from importlib import metadata
+
+# Libraries whose versions can change a candidate's behaviour
+TRACKED_LIBRARIES = ("numpy", "pandas", "scipy")
+
+# Return codes that say nothing about the candidate itself
+_UNCACHEABLE_CODES = (124, -9)
+
+
+def environment_fingerprint() -> str:
+    """
+    Interpreter and library versions, so an image upgrade never serves stale results.
+    """
+    parts = [sys.version]
+    for name in TRACKED_LIBRARIES:
+        try:
+            parts.append(f"{name}=={metadata.version(name)}")
+        except metadata.PackageNotFoundError:
+            parts.append(f"{name}==none")
+    return "\n".join(parts)
+
+
+class ResultCache:
+    """
+    Content-addressed cache of runner results.
+    Tier 1 is a bounded in-memory LRU; tier 2 (optional) is one JSON file per
+    key under disk_dir, which survives as long as the container's /tmp does.
+    """
+
+    def __init__(self, max_entries: int = 1024, disk_dir: str = None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._fingerprint = environment_fingerprint()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def key(self, candidate_code: str, test_code: str, timeout: int) -> str:
+        h = hashlib.sha256()
+        for part in (self._fingerprint, str(timeout), candidate_code, test_code):
+            data = part.encode("utf-8")
+            # Length-prefix each part so ("ab", "c") and ("a", "bc") differ
+            h.update(len(data).to_bytes(8, "big"))
+            h.update(data)
+        return h.hexdigest()
+
+    def get(self, key: str):
+        """
+        Returns the cached result dict, or None on a miss.
+        """
+        result = self._memory.get(key)
+        if result is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return dict(result)
+
+        result = self._read_disk(key)
+        if result is not None:
+            self._remember(key, result)
+            self.hits += 1
+            return dict(result)
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, result: dict):
+        """
+        Stores a result unless it reflects the sandbox rather than the code
+        (timeouts, cancelled race losers, internal errors).
+        """
+        if result.get("return_code") in _UNCACHEABLE_CODES:
+            return
+        if result.get("stderr", "").startswith("Sandbox Internal Error"):
+            return
+        self._remember(key, dict(result))
+        self._write_disk(key, result)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._memory)}
+
+    def clear(self):
+        self._memory.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, key: str, result: dict):
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key: str):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key: str, result: dict):
+        if not self.disk_dir:
+            return
+        try:
+            # Write then rename, so concurrent readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(result, f)
+            os.replace(tmp_path, self._disk_path(key))
+        except OSError as e:
+            print(f"Result cache write failed: {e}")
+
+
+default_cache = ResultCache(
+    max_entries=int(os.getenv("SANDBOX_CACHE_SIZE", "1024")),
+    disk_dir=os.getenv("SANDBOX_CACHE_DIR") or None,
+)
@@ -1,59 +1,308 @@
 import subprocess
 import os
 import sys
+import time
+import tempfile
+from . import forkserver
 
-def execute_verification(candidate_code: str, test_code: str, timeout: int = 5) -> dict:
+# How often in-flight runs are checked for completion (seconds)
+POLL_INTERVAL = 0.001
+
+
+def execute_verification(candidate_code: str, test_code: str, timeout: int = 5, mode: str = None) -> dict:
     """
-    Writes code to /tmp and executes the test script in a subprocess.
+    Writes code to a private temp dir and executes the test script in a subprocess.
+    mode: "subprocess" (fresh interpreter per run) or "fork" (copy-on-write child
+    of this warm process, see forkserver.py). Defaults to $SANDBOX_EXEC_MODE.
     Returns dictionary with return_code, stdout, stderr.
     """
-    tmp_dir = "/tmp"
-    
-    # On Windows (Local Testing), use a local temp dir if /tmp doesn't exist
-    if sys.platform == "win32":
-        tmp_dir = os.path.join(os.getcwd(), "temp_sandbox")
-        os.makedirs(tmp_dir, exist_ok=True)
-
-    fix_path = os.path.join(tmp_dir, "fix.py")
-    test_path = os.path.join(tmp_dir, "test.py")
-
-    try:
-        # Write files
-        with open(fix_path, "w") as f:
-            f.write(candidate_code)
-        
-        with open(test_path, "w") as f:
-            f.write(test_code)
-
-        # Execute
-        # We need to ensure the subprocess can find 'fix.py' in the same directory
-        env = os.environ.copy()
-        env["PYTHONPATH"] = tmp_dir
-        
-        result = subprocess.run(
-            [sys.executable, test_path],
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-            env=env,
-            cwd=tmp_dir # execute from the temp dir
-        )
-
-        return {
-            "return_code": result.returncode,
-            "stdout": result.stdout,
-            "stderr": result.stderr
-        }
-
-    except subprocess.TimeoutExpired:
-        return {
+    return execute_batch([candidate_code], test_code, timeout=timeout, mode=mode)[0]
+
+
+def execute_batch(candidates: list, test_code: str, timeout: int = 5, mode: str = None,
+                  max_workers: int = None) -> list:
+    """
+    Verifies every candidate against the same test script in parallel, with at
+    most max_workers (default: CPU count) running at once. Each run gets its own
+    work dir, so candidates never see each other's fix.py.
+    Returns one result dict per candidate, in candidate order.
+    """
+    results, _ = _run_all(candidates, test_code, timeout, mode, max_workers)
+    return results
+
+
+def execute_race(candidates: list, test_code: str, timeout: int = 5, mode: str = None,
+                 max_workers: int = None, expected_output: str = None) -> dict:
+    """
+    Like execute_batch, but the first candidate to exit 0 (with expected_output
+    in its stdout, if given) wins and every other run is killed immediately.
+    All candidates start at once unless max_workers is given.
+    Returns {"winner": index or None, "results": [...]}; cancelled candidates
+    get return_code -9.
+    """
+    max_workers = max_workers or len(candidates)
+
+    def passed(index, result):
+        return is_pass(result, expected_output)
+
+    results, winner = _run_all(candidates, test_code, timeout, mode, max_workers, stop_when=passed)
+    return {"winner": winner, "results": results}
+
+
+def execute_with_baseline(original_code: str, candidates: list, test_code: str, timeout: int = 5,
+                          mode: str = None, max_workers: int = None, race: bool = False,
+                          expected_output: str = None, baseline: dict = None) -> dict:
+    """
+    Runs the test script against the original code alongside the candidates.
+    A script the original already passes doesn't reproduce the bug, so it
+    can't tell the candidates apart: as soon as that is known, every
+    candidate still running is killed and the rest never start.
+    With race=True the first passing candidate wins (once the original is
+    known to fail). A known `baseline` result (e.g. from the result cache)
+    is used instead of running the original again.
+    Returns {"baseline", "reproduced", "results", "winner"}.
+    """
+    if baseline is not None:
+        if is_pass(baseline, expected_output):
+            return _not_reproduced(baseline, candidates)
+        if race:
+            raced = execute_race(candidates, test_code, timeout, mode, max_workers, expected_output)
+            return {"baseline": baseline, "reproduced": True, **raced}
+        results = execute_batch(candidates, test_code, timeout, mode, max_workers)
+        return {"baseline": baseline, "reproduced": True, "results": results, "winner": None}
+
+    state = {"baseline": None, "winner": None}
+
+    def settled(index, result):
+        if index == 0:
+            state["baseline"] = result
+            return is_pass(result, expected_output) or state["winner"] is not None
+        if race and state["winner"] is None and is_pass(result, expected_output):
+            state["winner"] = index - 1
+            return state["baseline"] is not None
+        return False
+
+    # The original goes first, so it is never left waiting for a worker
+    max_workers = max_workers or (len(candidates) + 1 if race else None)
+    results, _ = _run_all([original_code] + candidates, test_code, timeout, mode, max_workers, stop_when=settled)
+    baseline = results[0]
+    if is_pass(baseline, expected_output):
+        return _not_reproduced(baseline, candidates)
+    return {"baseline": baseline, "reproduced": True, "results": results[1:], "winner": state["winner"]}
+
+
+def _not_reproduced(baseline: dict, candidates: list) -> dict:
+    return {
+        "baseline": baseline,
+        "reproduced": False,
+        "results": [discarded_result() for _ in candidates],
+        "winner": None,
+    }
+
+
+def is_pass(result: dict, expected_output: str = None) -> bool:
+    """
+    A run passes when it exits 0 and, if given, printed expected_output.
+    """
+    if result.get("return_code") != 0:
+        return False
+    return expected_output is None or expected_output in result.get("stdout", "")
+
+
+def _run_all(candidates, test_code, timeout, mode, max_workers, stop_when=None):
+    """
+    Schedules Verifications until all have finished, or until
+    stop_when(index, result) is true for one. Returns (results, index of
+    that result or None).
+    """
+    mode = _resolve_mode(mode)
+    max_workers = max_workers or os.cpu_count() or 1
+
+    pending = list(enumerate(candidates))
+    running = {}
+    results = [None] * len(candidates)
+    stopped_at = None
+
+    while (pending or running) and stopped_at is None:
+        while pending and len(running) < max_workers:
+            index, candidate = pending.pop(0)
+            running[index] = Verification(candidate, test_code, timeout, mode)
+
+        for index, run in list(running.items()):
+            result = run.poll()
+            if result is None:
+                continue
+            results[index] = result
+            del running[index]
+            if stop_when is not None and stop_when(index, result):
+                stopped_at = index
+                break
+
+        if running and stopped_at is None:
+            time.sleep(POLL_INTERVAL)
+
+    # Early stop: kill whatever is still running and skip what never started
+    for index, run in running.items():
+        run.cancel()
+        results[index] = run.result
+    for index, _ in pending:
+        results[index] = cancelled_result()
+
+    return results, stopped_at
+
+
+class Verification:
+    """
+    A single candidate run, started on construction. fix.py and test.py live in
+    a private temp dir that is removed as soon as the result is collected.
+    Call poll() until it returns the result dict.
+    """
+
+    def __init__(self, candidate_code: str, test_code: str, timeout: int = 5, mode: str = None):
+        self.timeout = timeout
+        self.result = None
+        self._work_dir = None
+        self._proc = None
+        self._pid = None
+        self._stdout = None
+        self._stderr = None
+
+        try:
+            self._work_dir = tempfile.TemporaryDirectory(prefix="pve-", dir=_work_root())
+            work_dir = self._work_dir.name
+            fix_path = os.path.join(work_dir, "fix.py")
+            test_path = os.path.join(work_dir, "test.py")
+
+            # Write files
+            with open(fix_path, "w") as f:
+                f.write(candidate_code)
+
+            with open(test_path, "w") as f:
+                f.write(test_code)
+
+            # Unnamed files rather than pipes: a chatty candidate can't block on a full pipe
+            self._stdout = tempfile.TemporaryFile()
+            self._stderr = tempfile.TemporaryFile()
+            self._deadline = time.monotonic() + timeout
+
+            if _resolve_mode(mode) == "fork":
+                self._pid = forkserver.spawn(test_path, work_dir, self._stdout.fileno(), self._stderr.fileno())
+            else:
+                # We need to ensure the subprocess can find 'fix.py' in the same directory
+                env = os.environ.copy()
+                env["PYTHONPATH"] = work_dir
+
+                self._proc = subprocess.Popen(
+                    [sys.executable, test_path],
+                    stdout=self._stdout,
+                    stderr=self._stderr,
+                    env=env,
+                    cwd=work_dir # execute from the temp dir
+                )
+
+        except Exception as e:
+            self._finish({
+                "return_code": 1,
+                "stdout": "",
+                "stderr": f"Sandbox Internal Error: {str(e)}"
+            })
+
+    def poll(self):
+        """
+        Returns the result dict once the run has finished (or timed out), else None.
+        """
+        if self.result is not None:
+            return self.result
+
+        if self._pid is not None:
+            return_code = forkserver.poll(self._pid)
+        else:
+            return_code = self._proc.poll()
+
+        if return_code is None:
+            if time.monotonic() >= self._deadline:
+                self.kill()
+            return self.result
+
+        self._finish({
+            "return_code": return_code,
+            "stdout": _read(self._stdout),
+            "stderr": _read(self._stderr)
+        })
+        return self.result
+
+    def kill(self):
+        """
+        Stops the run if it is still going; its result becomes a timeout.
+        """
+        if self.result is not None:
+            return
+
+        self._stop()
+        self._finish({
             "return_code": 124, # Standard timeout exit code
             "stdout": "",
-            "stderr": f"Execution timed out after {timeout} seconds."
-        }
-    except Exception as e:
-        return {
-            "return_code": 1,
-            "stdout": "",
-            "stderr": f"Sandbox Internal Error: {str(e)}"
-        }
+            "stderr": f"Execution timed out after {self.timeout} seconds."
+        })
+
+    def cancel(self):
+        """
+        Stops the run because another candidate already won the race.
+        """
+        if self.result is not None:
+            return
+
+        self._stop()
+        self._finish(cancelled_result())
+
+    def _stop(self):
+        if self._pid is not None:
+            forkserver.kill(self._pid)
+        else:
+            self._proc.kill()
+            self._proc.wait()
+
+    def _finish(self, result: dict):
+        self.result = result
+        for f in (self._stdout, self._stderr):
+            if f is not None:
+                f.close()
+        if self._work_dir is not None:
+            self._work_dir.cleanup()
+
+
+def discarded_result() -> dict:
+    return {
+        "return_code": -9,
+        "stdout": "",
+        "stderr": "Discarded: the reproduction script passes on the original code."
+    }
+
+
+def cancelled_result() -> dict:
+    return {
+        "return_code": -9, # Killed, same as a SIGKILLed subprocess
+        "stdout": "",
+        "stderr": "Cancelled: another candidate passed first."
+    }
+
+
+def _resolve_mode(mode: str = None) -> str:
+    mode = mode or os.getenv("SANDBOX_EXEC_MODE", "subprocess")
+    if mode == "fork" and not forkserver.is_supported():
+        return "subprocess"
+    return mode
+
+
+def _work_root():
+    # On Windows (Local Testing), keep run dirs under a local temp dir
+    if sys.platform == "win32":
+        root = os.path.join(os.getcwd(), "temp_sandbox")
+        os.makedirs(root, exist_ok=True)
+        return root
+    return None # System temp dir (/tmp on Lambda)
+
+
+def _read(f) -> str:
+    f.seek(0)
+    return f.read().decode("utf-8", errors="replace")
@@ -1,41 +1,243 @@
 import re
+import ast
+import threading
+from collections import OrderedDict
+from typing import List, NamedTuple
+
+# Modules a candidate may not import at all
+BANNED_MODULES = {"os", "subprocess", "sys", "shutil"}
+
+# Dangerous attributes, flagged even when the module arrives without an import
+# (e.g. passed in as an argument). Entries ending in "*" are prefixes.
+# A banned module reached as an attribute of another (pathlib.os,
+# tempfile._os) is flagged on its own, whatever is done with it.
+BANNED_ATTRIBUTES = {
+    "os": ("system", "popen", "spawn*", "exec*"),
+    "subprocess": ("*",),
+}
+
+# Builtins that are blocked wherever they are referenced, called or not
+BANNED_BUILTINS = {
+    "eval",
+    "exec",
+    "open", # simplistic block, might be too aggressive but safe for PVE
+    "__import__",
+    "globals",
+    "locals",
+    "input", # blocking interactive input
+}
+
+# Every violation names one of these as a whole word, or after leading
+# underscores (_os). Pure-ASCII code without any of them is safe without parsing. (Non-ASCII code is always parsed: Python
+# NFKC-normalizes identifiers, so a full-width "ｅval" is eval.)
+_RISKY_WORDS = sorted(BANNED_MODULES | set(BANNED_ATTRIBUTES) | BANNED_BUILTINS)
+
+# The original regex pre-flight list. Only used for code that does not parse,
+# where the AST visitor has nothing to walk.
+LEGACY_PATTERNS = [
+    r"import\s+os",
+    r"from\s+os\s+import",
+    r"import\s+subprocess",
+    r"from\s+subprocess\s+import",
+    r"import\s+sys", # often used for sys.modules manipulation
+    r"import\s+shutil",
+    r"os\.system",
+    r"os\.popen",
+    r"os\.spawn",
+    r"os\.exec",
+    r"subprocess\.run",
+    r"subprocess\.Popen",
+    r"subprocess\.call",
+    r"subprocess\.check_output",
+    r"eval\(",
+    r"exec\(",
+    r"open\(",
+    r"__import__",
+    r"globals\(",
+    r"locals\(",
+    r"input\("
+]
+_LEGACY_REGEX = [re.compile(p) for p in LEGACY_PATTERNS]
+
+# Modules whose attributes are the builtins themselves (builtins.exec)
+_BUILTINS_MODULES = {"builtins", "__builtins__"}
+
+# Recently parsed trees, keyed by source: stages.screen parses a candidate for
+# its compile stage and the analyzer walks that same tree
+PARSE_CACHE_SIZE = 8
+_trees = OrderedDict()
+_trees_lock = threading.Lock()
+
+
+class Violation(NamedTuple):
+    line: int
+    col: int
+    rule: str
+    message: str
+
 
 def validate_code_safety(code: str) -> bool:
     """
-    Performs a regex-based pre-flight check to block dangerous patterns.
+    Performs an AST-based pre-flight check to block dangerous patterns.
     Returns True if safe, False if a violation is detected.
     """
     if not code:
         return False
 
-    # Blocked patterns (Imports and Function calls)
-    dangerous_patterns = [
-        r"import\s+os",
-        r"from\s+os\s+import",
-        r"import\s+subprocess",
-        r"from\s+subprocess\s+import",
-        r"import\s+sys", # often used for sys.modules manipulation
-        r"import\s+shutil",
-        r"os\.system",
-        r"os\.popen",
-        r"os\.spawn",
-        r"os\.exec",
-        r"subprocess\.run",
-        r"subprocess\.Popen",
-        r"subprocess\.call",
-        r"subprocess\.check_output",
-        r"eval\(",
-        r"exec\(",
-        r"open\(", # simplistic block, might be too aggressive but safe for PVE
-        r"__import__",
-        r"globals\(",
-        r"locals\(",
-        r"input\(" # blocking interactive input
-    ]
-
-    for pattern in dangerous_patterns:
-        if re.search(pattern, code):
-            print(f"Security Violation Detected: Matches pattern '{pattern}'")
-            return False
-
-    return True
+    violations = find_violations(code)
+    for v in violations:
+        print(f"Security Violation Detected: {v.message} (line {v.line}, col {v.col})")
+
+    return not violations
+
+
+def find_violations(code: str, tree: ast.Module = None) -> List[Violation]:
+    """
+    Parses the code once and reports every banned import, attribute and builtin
+    with its position. Comments and string literals never match.
+    Pass `tree` when the caller has already parsed the code.
+    Only the top-level statements spanning a line with a risky word are
+    walked (the whole tree for non-ASCII code).
+    """
+    lines = _risky_lines(code) if code.isascii() else None
+    if lines is not None and not lines:
+        return []
+
+    if tree is None:
+        try:
+            tree = parse(code)
+        except (SyntaxError, ValueError):
+            return _find_legacy_violations(code)
+
+    visitor = _SecurityVisitor(_builtins_aliases(tree) if "builtins" in code else ())
+    for node in (_risky_statements(tree, lines) if lines is not None else [tree]):
+        visitor.visit(node)
+    return visitor.violations
+
+
+def parse(code: str, filename: str = "<unknown>") -> ast.Module:
+    """
+    ast.parse, reusing the tree of a recent identical source. Callers must
+    not modify the tree. Failures aren't cached; SyntaxError and ValueError
+    propagate as from ast.parse.
+    """
+    with _trees_lock:
+        tree = _trees.get(code)
+        if tree is not None:
+            _trees.move_to_end(code)
+            return tree
+    tree = ast.parse(code, filename)
+    with _trees_lock:
+        _trees[code] = tree
+        while len(_trees) > PARSE_CACHE_SIZE:
+            _trees.popitem(last=False)
+    return tree
+
+
+class _SecurityVisitor(ast.NodeVisitor):
+
+    def __init__(self, builtins_aliases=()):
+        self.violations = []
+        # Names the builtins module is bound to, wherever the import is
+        self.builtins_names = _BUILTINS_MODULES | set(builtins_aliases)
+
+    def _report(self, node, rule, message):
+        self.violations.append(Violation(node.lineno, node.col_offset, rule, message))
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            if alias.name.split(".")[0] in BANNED_MODULES:
+                self._report(node, "banned-import", f"import of '{alias.name}'")
+        self.generic_visit(node)
+
+    def visit_ImportFrom(self, node):
+        if node.level == 0 and node.module and node.module.split(".")[0] in BANNED_MODULES:
+            self._report(node, "banned-import", f"import from '{node.module}'")
+        elif any(_module_name(alias.name) in BANNED_MODULES for alias in node.names):
+            # from pathlib import os, from tempfile import _os
+            self._report(node, "banned-import", f"import of a banned module from '{node.module or '.'}'")
+        elif node.level == 0 and node.module == "builtins":
+            for alias in node.names:
+                if alias.name in BANNED_BUILTINS:
+                    self._report(node, "banned-builtin", f"import of 'builtins.{alias.name}'")
+        self.generic_visit(node)
+
+    def visit_Attribute(self, node):
+        if node.attr == "__import__":
+            self._report(node, "banned-builtin", "use of '__import__'")
+        elif (node.attr in BANNED_BUILTINS and isinstance(node.value, ast.Name)
+              and node.value.id in self.builtins_names):
+            self._report(node, "banned-builtin", f"use of '{node.value.id}.{node.attr}'")
+        elif _module_name(node.attr) in BANNED_MODULES:
+            self._report(node, "banned-attribute", f"use of module '{node.attr}' through an attribute")
+        elif isinstance(node.value, ast.Name) and _module_name(node.value.id) in BANNED_ATTRIBUTES:
+            for banned in BANNED_ATTRIBUTES[_module_name(node.value.id)]:
+                if banned == node.attr or (banned.endswith("*") and node.attr.startswith(banned[:-1])):
+                    self._report(node, "banned-attribute", f"use of '{node.value.id}.{node.attr}'")
+                    break
+        self.generic_visit(node)
+
+    def visit_Name(self, node):
+        if node.id in BANNED_BUILTINS and isinstance(node.ctx, ast.Load):
+            self._report(node, "banned-builtin", f"use of '{node.id}'")
+
+
+def _risky_statements(tree: ast.Module, lines: set) -> list:
+    # Every banned name is spelled out in the source text, so a statement
+    # without a risky word on any of its lines can't hold a violation
+    statements = []
+    for stmt in tree.body:
+        first = min([stmt.lineno] + [d.lineno for d in getattr(stmt, "decorator_list", [])])
+        if any(first <= line <= stmt.end_lineno for line in lines):
+            statements.append(stmt)
+    return statements
+
+
+def _risky_lines(code: str) -> set:
+    # Line numbers with a risky whole word. str.find per word present is far
+    # cheaper than one regex pass over a long file
+    positions = []
+    for word in _RISKY_WORDS:
+        start = code.find(word)
+        while start != -1:
+            end = start + len(word)
+            before = start
+            while before and code[before - 1] == "_":
+                before -= 1
+            if not (before and _is_word_char(code[before - 1])) and not (end < len(code) and _is_word_char(code[end])):
+                positions.append(start)
+            start = code.find(word, start + 1)
+    lines, line, last = set(), 1, 0
+    for position in sorted(positions):
+        line += code.count("\n", last, position)
+        last = position
+        lines.add(line)
+    return lines
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+def _module_name(name: str) -> str:
+    # Modules re-exported privately keep their name after the underscores
+    # (tempfile._os is os)
+    return name.lstrip("_")
+
+
+def _builtins_aliases(tree: ast.Module) -> set:
+    # import builtins as b
+    return {alias.asname for node in ast.walk(tree) if isinstance(node, ast.Import)
+            for alias in node.names if alias.name == "builtins" and alias.asname}
+
+
+def _find_legacy_violations(code: str) -> List[Violation]:
+    violations = []
+    for pattern, regex in zip(LEGACY_PATTERNS, _LEGACY_REGEX):
+        for match in regex.finditer(code):
+            line_start = code.rfind("\n", 0, match.start()) + 1
+            line = code.count("\n", 0, match.start()) + 1
+            violations.append(Violation(line, match.start() - line_start, "legacy-pattern",
+                                        f"matches pattern '{pattern}'"))
+    violations.sort()
+    return violations
@@ -0,0 +1,185 @@
+import ast
+import time
+import builtins
+import importlib.util
+from typing import NamedTuple
+from . import security
+
+# Cheapest first; a candidate rejected by one stage never reaches the next,
+# and only candidates that pass all of them are run.
+STAGES = ("compile", "lint", "security")
+
+# Module-level names Python provides besides the builtins
+_IMPLICIT_NAMES = set(dir(builtins)) | {"__file__", "__builtins__", "__annotations__", "__cached__", "__class__"}
+
+# Top-level module -> importable? (the image's packages don't change while warm)
+_spec_cache = {}
+
+
+class Rejection(NamedTuple):
+    stage: str
+    # Runner-style result dict ("compile"/"lint"), or security.Violation list ("security")
+    detail: object
+
+
+def new_report() -> dict:
+    return {stage: {"checked": 0, "rejected": 0, "seconds": 0.0} for stage in STAGES}
+
+
+_totals = new_report()
+
+
+def screen(code: str, report: dict = None):
+    """
+    Runs the pre-execution stages in order: compile(), an undefined-name and
+    missing-import check, then the security analyzer.
+    Returns the first Rejection, or None when the candidate should be run.
+    Per-stage counts and timings go to `report` (see new_report) and to the
+    process-wide totals.
+    """
+    tree = None
+
+    def compile_stage():
+        nonlocal tree
+        try:
+            tree = security.parse(code, "fix.py")
+            compile(tree, "fix.py", "exec")
+        except (SyntaxError, ValueError) as e:
+            return _failed_run(f"{type(e).__name__}: {e}", "compile")
+
+    def lint_stage():
+        error = _lint(tree)
+        if error:
+            return _failed_run(error, "lint")
+
+    def security_stage():
+        return security.find_violations(code, tree) or None
+
+    for stage, check in zip(STAGES, (compile_stage, lint_stage, security_stage)):
+        t0 = time.perf_counter()
+        detail = check()
+        elapsed = time.perf_counter() - t0
+        for counts in (report, _totals):
+            if counts is not None:
+                counts[stage]["checked"] += 1
+                counts[stage]["seconds"] += elapsed
+                counts[stage]["rejected"] += detail is not None
+        if detail is not None:
+            return Rejection(stage, detail)
+    return None
+
+
+def get_stats() -> dict:
+    """
+    Per-stage totals for this warm container.
+    """
+    return {stage: dict(counts) for stage, counts in _totals.items()}
+
+
+def _failed_run(message: str, stage: str) -> dict:
+    # Shaped like a runner result: the test would have died the same way on import
+    return {
+        "return_code": 1,
+        "stdout": "",
+        "stderr": message,
+        "stage": stage,
+    }
+
+
+class _NameCollector(ast.NodeVisitor):
+    """
+    Every name the module binds anywhere, and every name it reads.
+    Scopes are ignored, so this only catches names defined nowhere at all.
+    Annotations are skipped (they may be strings or postponed).
+    """
+
+    def __init__(self):
+        self.bound = set()
+        self.loaded = []
+        self.star_import = False
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load):
+            self.loaded.append(node)
+        else:
+            self.bound.add(node.id)
+
+    def _visit_function(self, node):
+        self.bound.add(node.name)
+        for decorator in node.decorator_list:
+            self.visit(decorator)
+        self.visit(node.args)
+        for stmt in node.body:
+            self.visit(stmt)
+
+    visit_FunctionDef = _visit_function
+    visit_AsyncFunctionDef = _visit_function
+
+    def visit_ClassDef(self, node):
+        self.bound.add(node.name)
+        self.generic_visit(node)
+
+    def visit_arg(self, node):
+        self.bound.add(node.arg)
+
+    def visit_AnnAssign(self, node):
+        self.visit(node.target)
+        if node.value is not None:
+            self.visit(node.value)
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.bound.add(alias.asname or alias.name.split(".")[0])
+
+    def visit_ImportFrom(self, node):
+        for alias in node.names:
+            if alias.name == "*":
+                self.star_import = True
+            self.bound.add(alias.asname or alias.name)
+
+    def visit_Global(self, node):
+        self.bound.update(node.names)
+
+    visit_Nonlocal = visit_Global
+
+    def generic_visit(self, node):
+        # except ... as e, match captures, lambda/type parameters
+        for field in ("name", "rest"):
+            value = getattr(node, field, None)
+            if isinstance(value, str):
+                self.bound.add(value)
+        super().generic_visit(node)
+
+
+def _lint(tree: ast.Module):
+    collector = _NameCollector()
+    collector.visit(tree)
+    if not collector.star_import:
+        for node in collector.loaded:
+            if node.id not in collector.bound and node.id not in _IMPLICIT_NAMES:
+                return f"NameError: name '{node.id}' is not defined (fix.py, line {node.lineno})"
+
+    # Only unconditional module-level imports: ones inside try/if may be optional
+    for stmt in tree.body:
+        if isinstance(stmt, ast.Import):
+            modules = [alias.name for alias in stmt.names]
+        elif isinstance(stmt, ast.ImportFrom) and stmt.level == 0 and stmt.module:
+            modules = [stmt.module]
+        else:
+            continue
+        for module in modules:
+            top = module.split(".")[0]
+            if not _importable(top):
+                return f"ModuleNotFoundError: No module named '{top}' (fix.py, line {stmt.lineno})"
+    return None
+
+
+def _importable(module: str) -> bool:
+    found = _spec_cache.get(module)
+    if found is None:
+        try:
+            found = importlib.util.find_spec(module) is not None
+        except (ImportError, ValueError):
+            found = False
+        _spec_cache[module] = found
+    return found
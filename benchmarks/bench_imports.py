@@ -0,0 +1,52 @@
+"""
+Truth Engine - Controller Cold-Start Import Report
+Runs `python -X importtime` on the controller handler in a fresh interpreter
+and lists the slowest imports by cumulative time. Provider SDKs and pydantic
+should not appear: they are imported on first use.
+
+    python benchmarks/bench_imports.py            # import main (Lambda init)
+    python benchmarks/bench_imports.py --request  # plus the lazy imports a
+                                                  # Gemini request triggers
+"""
+
+import os
+import sys
+import subprocess
+
+CONTROLLER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend/controller'))
+
+# Never expected in Lambda init
+LAZY_MODULES = ("google.generativeai", "groq", "openai", "boto3", "pydantic")
+
+def import_report(statement="import main"):
+    """
+    {module: (self_us, cumulative_us)} for one fresh interpreter run.
+    """
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                          cwd=CONTROLLER_DIR, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+    report = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        report[name.strip()] = (int(self_us), int(cumulative_us))
+    return report
+
+def main():
+    statement = "import main"
+    if "--request" in sys.argv:
+        statement += "; from ag import providers, schemas; schemas.packet_adapter()"
+        os.environ.setdefault("GEMINI_API_KEY", "bench-placeholder")
+        statement += "; providers.gemini_model({})"
+
+    report = import_report(statement)
+    print(f"{'module':<40} {'cumulative ms':>14}")
+    for name, (_, cumulative) in sorted(report.items(), key=lambda item: -item[1][1])[:20]:
+        print(f"{name:<40} {cumulative / 1000:>14.1f}")
+    print(f"\nmain: {report['main'][1] / 1000:.1f} ms")
+    print(f"lazy modules loaded: {[m for m in LAZY_MODULES if m in report] or 'none'}")
+
+if __name__ == "__main__":
+    main()
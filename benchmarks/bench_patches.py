@@ -0,0 +1,40 @@
+"""
+Truth Engine - Patch Candidate Benchmark
+Output size of one candidate as a full file vs. as a unified diff
+(ag.patches) on the bench_slicer corpus, plus the cost of applying the
+diff server-side. Tokens are approximated as word/punctuation runs.
+
+    python benchmarks/bench_patches.py
+"""
+
+import os
+import sys
+import time
+import difflib
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend/controller')))
+
+from ag import patches
+from bench_slicer import make_case, tokens
+
+BUG = "        return sum(totals) / len(totals)"
+FIX = "        if not totals:\n            return 0.0\n        return sum(totals) / len(totals)"
+
+def main():
+    print(f"{'lines':>6} {'full tok':>9} {'diff tok':>9} {'ratio':>7} {'apply ms':>9}")
+    for units in (15, 50, 150, 400):
+        code, _ = make_case(units)
+        fixed = code.replace(BUG, FIX)
+        diff = "".join(difflib.unified_diff(
+            code.splitlines(keepends=True), fixed.splitlines(keepends=True), "a/code.py", "b/code.py"))
+
+        t0 = time.perf_counter()
+        applied = patches.apply_patch(code, diff)
+        apply_ms = (time.perf_counter() - t0) * 1000
+        assert applied == fixed
+
+        full, patch = tokens(fixed), tokens(diff)
+        print(f"{code.count(chr(10)):>6} {full:>9} {patch:>9} {full / patch:>6.0f}x {apply_ms:>9.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Truth Engine - Provider Client Benchmark
+Per-request client setup cost on a warm process: building fresh SDK clients
+(the old path) vs. the shared ag.providers registry.
+
+    python benchmarks/bench_providers.py          # setup cost only, no network
+    python benchmarks/bench_providers.py --live   # also times real Groq calls
+                                                  # (needs GROQ_API_KEY)
+"""
+
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend/controller')))
+
+from dotenv import load_dotenv
+load_dotenv(os.path.join(os.path.dirname(__file__), '../backend/controller/.env'))
+
+from ag import brain, providers
+
+def time_it(func, repeat):
+    func()  # warm-up: the first call pays the one-off cost on both paths
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - t0) / repeat * 1000
+
+def fresh_clients():
+    from groq import Groq
+    from openai import OpenAI
+    import google.generativeai as genai
+    Groq(api_key=os.environ["GROQ_API_KEY"])
+    OpenAI(api_key=os.environ["DEEPSEEK_API_KEY"], base_url=providers.DEEPSEEK_BASE_URL)
+    genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+    genai.GenerativeModel(model_name=providers.GEMINI_MODEL, generation_config=brain.GENERATION_CONFIG)
+
+def shared_clients():
+    providers.groq_client()
+    providers.deepseek_client()
+    providers.gemini_model(brain.GENERATION_CONFIG)
+
+def live_call(client):
+    client.chat.completions.create(
+        messages=[{"role": "user", "content": "Hi"}],
+        model="llama-3.1-8b-instant",
+        max_tokens=1,
+    )
+
+def main():
+    for name in ("GROQ_API_KEY", "DEEPSEEK_API_KEY", "GEMINI_API_KEY"):
+        os.environ.setdefault(name, "bench-placeholder")
+
+    print(f"client setup, fresh per request: {time_it(fresh_clients, 50):8.2f} ms")
+    print(f"client setup, shared registry:   {time_it(shared_clients, 50):8.2f} ms")
+
+    if "--live" in sys.argv:
+        from groq import Groq
+        print(f"groq call, fresh client:  {time_it(lambda: live_call(Groq(api_key=os.environ['GROQ_API_KEY'])), 10):8.2f} ms")
+        print(f"groq call, shared client: {time_it(lambda: live_call(providers.groq_client()), 10):8.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Truth Engine - Candidate Ranking Benchmark
+Time to the first verified fix when candidates run in the model's order vs.
+the order ag.ranker picks, on the bench_slicer corpus. Each packet holds the
+real fix plus decoys of the kinds the models return (an unchanged copy, a
+rewrite of the wrong function, a file that doesn't parse), in a seeded random
+"model" order. Candidates race in the real sandbox runner with a limited
+number of slots, like the Step Functions Map's MaxConcurrency.
+
+    python benchmarks/bench_ranker.py              # one slot
+    python benchmarks/bench_ranker.py --slots 2
+"""
+
+import os
+import sys
+import time
+import random
+import statistics
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend/controller')))
+
+from ag import ranker
+from sandbox import runner
+from bench_slicer import make_case
+from bench_patches import BUG, FIX
+
+SCRIPT = 'import runpy\n\nrunpy.run_path("fix.py", run_name="__main__")\n'
+PACKETS_PER_CASE = 8
+CANDIDATES_PER_PACKET = 3
+
+def decoys(code, units):
+    # Plausible wrong answers: none of them stops the ZeroDivisionError
+    normalize = f"def normalize_{units // 2}(record):"
+    return [
+        code,
+        code.replace(normalize, normalize + "\n    if not record:\n        return {}"),
+        code.replace("    def average_total(self):", "    def average_total(self)"),
+        code.replace("        cleaned = {}", "        cleaned = dict()\n        record = dict(record)"),
+    ]
+
+def time_to_fix(candidates, slots):
+    t0 = time.perf_counter()
+    raced = runner.execute_race(candidates, SCRIPT, max_workers=slots)
+    if raced["winner"] is None:
+        raise RuntimeError("no candidate passed")
+    return (time.perf_counter() - t0) * 1000
+
+def main():
+    slots = int(sys.argv[sys.argv.index("--slots") + 1]) if "--slots" in sys.argv else 1
+    rng = random.Random(7)
+    model_ms, ranked_ms, rank_ms, first = [], [], [], 0
+    for units in (15, 50, 150):
+        code, error_log = make_case(units)
+        fixed = code.replace(BUG, FIX)
+        for _ in range(PACKETS_PER_CASE):
+            packet = rng.sample(decoys(code, units), CANDIDATES_PER_PACKET - 1) + [fixed]
+            rng.shuffle(packet)
+
+            t0 = time.perf_counter()
+            order = ranker.rank(packet, code, error_log, "RUNTIME")
+            rank_ms.append((time.perf_counter() - t0) * 1000)
+            first += packet[order[0]] == fixed
+
+            model_ms.append(time_to_fix(packet, slots))
+            ranked_ms.append(time_to_fix([packet[i] for i in order], slots))
+
+    packets = len(model_ms)
+    print(f"{packets} packets of {CANDIDATES_PER_PACKET} candidates, {slots} sandbox slot(s)")
+    print(f"{'order':>8} {'median ms':>10} {'p90 ms':>8}")
+    for name, samples in (("model", model_ms), ("ranked", ranked_ms)):
+        print(f"{name:>8} {statistics.median(samples):>10.1f} {statistics.quantiles(samples, n=10)[-1]:>8.1f}")
+    print(f"\nFix ranked first: {first}/{packets}, ranking cost: median {statistics.median(rank_ms):.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Truth Engine - FixPacket Validation Benchmark
+Model response text -> validated packet dict, the old way
+(json.loads -> FixPacket(**obj) -> model_dump) vs. the precompiled
+ag.schemas adapter, on packets of a few hundred KB. "+body" adds the
+json.dumps of the response both paths still share.
+
+    python benchmarks/bench_schemas.py
+"""
+
+import os
+import sys
+import json
+import time
+from typing import List
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend/controller')))
+
+from pydantic import BaseModel
+from ag import schemas
+
+class LegacyFixPacket(BaseModel):
+    """The pre-TypeAdapter schema."""
+    reproduction_script: str
+    candidates: List[str]
+
+LINE = 'def handler_{i}(event):\n    return {{"id": event["id"], "name": "café"}}  # {i}\n'
+
+def make_response(lines_per_candidate):
+    candidates = ["".join(LINE.format(i=i + c) for i in range(lines_per_candidate)) for c in range(3)]
+    return json.dumps({"reproduction_script": "from fix import handler_0\n" * 50, "candidates": candidates})
+
+def legacy(text):
+    return LegacyFixPacket(**json.loads(text)).model_dump()
+
+def fast(text):
+    return schemas.packet_from_json(text)
+
+def with_body(parse):
+    return lambda text: json.dumps({"status": "success", "data": parse(text)})
+
+def time_it(func, text, repeat=50):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(text)
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+def main():
+    print(f"{'packet KB':>10} {'legacy ms':>10} {'adapter ms':>11} {'speedup':>8} {'+body':>14}")
+    for lines in (500, 1500, 4000):
+        text = make_response(lines)
+        assert legacy(text) == fast(text)
+        old_ms, new_ms = time_it(legacy, text), time_it(fast, text)
+        old_body, new_body = time_it(with_body(legacy), text), time_it(with_body(fast), text)
+        print(f"{len(text) // 1024:>10} {old_ms:>10.2f} {new_ms:>11.2f} {old_ms / new_ms:>7.1f}x "
+              f"{old_body:>6.2f}/{new_body:<6.2f}")
+
+if __name__ == "__main__":
+    main()
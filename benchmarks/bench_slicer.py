@@ -0,0 +1,117 @@
+"""
+Truth Engine - Code Slicer Benchmark
+Prompt size with the full file vs. the traceback slice (ag.slicer) on a
+generated corpus of service-style modules, each with one bug deep in a
+call chain. Tokens are approximated as word/punctuation runs.
+
+    python benchmarks/bench_slicer.py          # prompt tokens + slicing cost
+    python benchmarks/bench_slicer.py --live   # also times real Gemini calls
+                                               # (needs GEMINI_API_KEY)
+"""
+
+import os
+import re
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend/controller')))
+
+from dotenv import load_dotenv
+load_dotenv(os.path.join(os.path.dirname(__file__), '../backend/controller/.env'))
+
+from ag import brain, slicer
+
+HEADER = '''"""Order service."""
+import json
+import math
+from collections import defaultdict
+
+TAX_RATE = 0.2
+'''
+
+UNIT = '''
+
+def normalize_{i}(record):
+    """Clean up record {i}."""
+    cleaned = {{}}
+    for key, value in record.items():
+        if isinstance(value, str):
+            cleaned[key.lower()] = value.strip()
+        else:
+            cleaned[key.lower()] = value
+    return cleaned
+'''
+
+BUGGY = '''
+
+class Ledger:
+    def __init__(self, orders):
+        self.orders = orders
+
+    def average_total(self):
+        totals = [o["total"] for o in self.orders]
+        return sum(totals) / len(totals)
+
+
+def summarize(orders):
+    ledger = Ledger([normalize_{i}(o) for o in orders])
+    return {{"average": ledger.average_total() * (1 + TAX_RATE)}}
+
+
+def main():
+    print(json.dumps(summarize([])))
+
+
+if __name__ == "__main__":
+    main()
+'''
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+def tokens(text):
+    return len(_TOKEN.findall(text))
+
+def make_case(units):
+    code = HEADER + "".join(UNIT.format(i=i) for i in range(units)) + BUGGY.format(i=units // 2)
+    lines = code.splitlines()
+    def line_of(text):
+        return next(n for n, line in enumerate(lines, start=1) if text in line)
+    error_log = (
+        "Traceback (most recent call last):\n"
+        f'  File "/tmp/upload/service.py", line {line_of("    main()")}, in <module>\n'
+        f'  File "/tmp/upload/service.py", line {line_of("print(json.dumps")}, in main\n'
+        f'  File "/tmp/upload/service.py", line {line_of("ledger.average_total()")}, in summarize\n'
+        f'  File "/tmp/upload/service.py", line {line_of("return sum(totals)")}, in average_total\n'
+        "ZeroDivisionError: division by zero"
+    )
+    return code, error_log
+
+def prompt_tokens(code, error_log):
+    return sum(tokens(p) for p in brain._build_prompts(code, error_log, "RUNTIME"))
+
+def live_call(code, error_log):
+    t0 = time.perf_counter()
+    brain.generate_fix_packet(code, error_log, "RUNTIME")
+    return (time.perf_counter() - t0) * 1000
+
+def main():
+    print(f"{'lines':>6} {'full tok':>9} {'slice tok':>10} {'saved':>7} {'slice ms':>9}")
+    cases = [make_case(units) for units in (15, 50, 150, 400)]
+    for code, error_log in cases:
+        t0 = time.perf_counter()
+        code_slice = slicer.slice_code(code, error_log)
+        slice_ms = (time.perf_counter() - t0) * 1000
+        full = prompt_tokens(code, error_log)
+        sliced = prompt_tokens(code_slice.code, code_slice.error_log) if code_slice else full
+        print(f"{code.count(chr(10)):>6} {full:>9} {sliced:>10} {1 - sliced / full:>7.0%} {slice_ms:>9.2f}")
+
+    if "--live" in sys.argv:
+        print(f"\n{'lines':>6} {'full ms':>9} {'slice ms':>9}")
+        for code, error_log in cases:
+            code_slice = slicer.slice_code(code, error_log)
+            full_ms = live_call(code, error_log)
+            slice_ms = live_call(code_slice.code, code_slice.error_log) if code_slice else full_ms
+            print(f"{code.count(chr(10)):>6} {full_ms:>9.0f} {slice_ms:>9.0f}")
+
+if __name__ == "__main__":
+    main()